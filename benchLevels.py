@@ -0,0 +1,447 @@
+# Reproducible benchmarks for the level browser.
+#
+#   python benchLevels.py generate --dir bench --levels 100000
+#   python benchLevels.py run --dir bench --output results.json
+#
+# generate builds a synthetic levels.db, a matching SAVE_DIR and a music
+# library from a fixed seed. run replays a fixed workload of searches, deep
+# pages, sorts, downloads and song lookups against the Flask app, with the
+# CDN and Boomlings replaced by a local stub, plus timings of the hot
+# helpers. Results (latency percentiles, throughput, peak RSS) go out as JSON.
+
+import argparse
+import base64
+import http.server
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+import urllib.parse
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    # Windows: no peak RSS in the results
+    resource = None
+
+import browseUnlisted as browser
+import ingestLevels
+
+# --- Synthetic Dataset ---
+
+WORDS = (
+    "dash", "wave", "neon", "cube", "ship", "void", "pulse", "storm", "night",
+    "crystal", "fire", "ice", "dream", "chaos", "light", "shadow", "sky", "core",
+)
+LENGTHS = ("Tiny", "Short", "Medium", "Long", "XL", "Platformer")
+LENGTH_WEIGHTS = (10, 25, 30, 25, 8, 2)
+# Level strings are log-normal around ~20 KB with a tail of multi-MB levels
+LEVEL_SIZE_MEDIAN = 20000
+LEVEL_SIZE_SIGMA = 1.6
+LEVEL_SIZE_MIN = 200
+# Files per directory under SAVE_DIR
+SAVE_DIR_FANOUT = 10000
+OFFICIAL_SONGS = 500
+LIBRARY_SONG_BASE = 10000000
+LIBRARY_SONGS = 5000
+
+def _random_words(rng, count):
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+def _song_ids(rng):
+    # Mostly a single Newgrounds song, some library songs, a few multi-song levels
+    count = rng.choices((1, 2, 3), (85, 10, 5))[0]
+    songs = []
+    for _ in range(count):
+        if rng.random() < 0.3:
+            songs.append(LIBRARY_SONG_BASE + rng.randrange(LIBRARY_SONGS))
+        else:
+            songs.append(1 + int(rng.paretovariate(1.2)) % OFFICIAL_SONGS)
+    return ",".join(map(str, songs))
+
+def generate(out_dir, levels, seed, file_ratio, max_level_bytes):
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    db_file = os.path.join(out_dir, browser.DB_FILE)
+    save_dir = os.path.join(out_dir, browser.SAVE_DIR)
+    for path in (db_file, db_file + "-wal", db_file + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(save_dir, ignore_errors=True)
+
+    # Level strings are slices of one random base64 blob
+    blob = base64.b64encode(rng.randbytes(max_level_bytes * 3 // 4 + 3)).decode("ascii")
+    creators = [f"{rng.choice(WORDS)}{rng.randrange(10000)}" for _ in range(max(levels // 20, 10))]
+
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executescript(ingestLevels.SCHEMA)
+    insert = ingestLevels.insert_sql()
+    rows = []
+    files = 0
+    file_bytes = 0
+    for level_id in range(1, levels + 1):
+        name = _random_words(rng, rng.randint(1, 3))
+        description = _random_words(rng, 6)
+        songs = _song_ids(rng)
+        level_len = int(min(max(rng.lognormvariate(math.log(LEVEL_SIZE_MEDIAN), LEVEL_SIZE_SIGMA),
+                                LEVEL_SIZE_MIN), max_level_bytes))
+        level_len -= level_len % 4
+        rcoins = rng.choices((0, 1, 2, 3), (60, 15, 10, 15))[0]
+        fields = {
+            "1": level_id, "2": name, "3": base64.urlsafe_b64encode(description.encode()).decode(),
+            "5": rng.randint(1, 30), "13": 21, "15": rng.choices(range(6), LENGTH_WEIGHTS)[0],
+            "30": 0 if rng.random() < 0.9 else rng.randrange(1, level_id + 1),
+            "31": int(rng.random() < 0.05), "35": songs.split(",")[0], "37": rcoins,
+            "38": int(rcoins > 0 and rng.random() < 0.5), "39": rng.randint(0, 10),
+            "45": rng.randint(1, max(level_len // 20, 2)),
+            "46": rng.randint(0, 360000), "47": rng.randint(0, 360000),
+        }
+        if "," in songs:
+            fields["52"] = songs
+        start = rng.randrange(0, len(blob) - level_len + 1)
+        fields["4"] = blob[start:start + level_len]
+        data = ":".join(f"{k}:{v}" for k, v in fields.items())
+        size = len(data)
+
+        if rng.random() < file_ratio:
+            directory = os.path.join(save_dir, f"{level_id // SAVE_DIR_FANOUT:04d}")
+            if files % SAVE_DIR_FANOUT == 0 or not os.path.isdir(directory):
+                os.makedirs(directory, exist_ok=True)
+            safe_name = "".join(c for c in name if c.isalnum() or c == " ")
+            with open(os.path.join(directory, f"{level_id} - {safe_name}.txt"), "w") as f:
+                f.write(data)
+            files += 1
+            file_bytes += size
+
+        rows.append((
+            level_id, name, rng.choice(creators), rng.choice((0, 0, 0, 1, 2, 5, "")),
+            description, f"{size} B", songs, str(fields["30"]), str(rcoins),
+            str(fields["38"]), str(fields["5"]), LENGTHS[fields["15"]],
+            rng.choice(("", str(fields["46"]))), str(fields["47"]), str(fields["39"]),
+            "Yes" if fields["31"] else "No", str(fields["45"]),
+        ))
+        if len(rows) >= ingestLevels.BATCH_SIZE:
+            with conn:
+                conn.executemany(insert, rows)
+            rows = []
+    with conn:
+        conn.executemany(insert, rows)
+    conn.close()
+    browser.migrate_db(db_file)
+
+    library = ";".join(f"{LIBRARY_SONG_BASE + i},{_random_words(rng, 2)},1" for i in range(LIBRARY_SONGS))
+    with open(os.path.join(out_dir, browser.MUSIC_LIB_FILE), "wb") as f:
+        f.write(base64.urlsafe_b64encode(zlib.compress(f"1|1,bench|{library}|".encode())))
+
+    manifest = {"levels": levels, "seed": seed, "file_ratio": file_ratio,
+                "max_level_bytes": max_level_bytes, "files": files, "file_bytes": file_bytes}
+    with open(os.path.join(out_dir, "bench.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Generated {levels} levels, {files} files ({browser.format_size(f'{file_bytes} B')}) in {out_dir}")
+
+# --- Upstream Stub ---
+
+class StubUpstream(http.server.BaseHTTPRequestHandler):
+    """Stands in for Boomlings (POST) and the song CDN (GET)."""
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    song_bytes = 1024 * 1024
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body):
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        form = urllib.parse.parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        song_id = form["songID"][0]
+        url = f"http://127.0.0.1:{self.server.server_port}/song/{song_id}.mp3"
+        self._reply(f"1~|~{song_id}~|~2~|~Song {song_id}~|~10~|~{urllib.parse.quote(url, safe='')}".encode())
+
+    def do_GET(self):
+        self._reply(b"\0" * self.song_bytes)
+
+def start_stub(latency):
+    StubUpstream.latency = latency
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubUpstream)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# --- Workload ---
+
+# The sorts the app supports; anything else falls back to ID
+SORT_COLUMNS = ("ID", "CreatorPoints", "Size")
+
+def build_workload(rng, conn):
+    """Return [(category, url)] for one round, deterministic for a given dataset and seed."""
+    max_id = conn.execute("SELECT MAX(ID) FROM levels").fetchone()[0]
+    sample = conn.execute(
+        "SELECT ID, Name, Username, songID FROM levels WHERE ID IN "
+        "(SELECT value FROM json_each(?))",
+        (json.dumps([rng.randint(1, max_id) for _ in range(200)]),)
+    ).fetchall()
+
+    ops = []
+    def search(category, **args):
+        ops.append((category, "/?" + urllib.parse.urlencode(args)))
+
+    for level_id, name, username, songs in sample[:40]:
+        word = name.split()[0]
+        search("filter_name", name=word)
+        search("filter_username", username=username, search_mode="exclusive")
+        search("filter_song", song_id=songs.split(",")[0])
+        search("filter_combined", name=word, min_size=10000, max_size=2000000, length="Medium")
+    for _ in range(20):
+        low = rng.randint(0, 100000)
+        search("filter_range", min_object_count=low, max_object_count=low + rng.randint(100, 5000),
+               min_editor_time=rng.randint(0, 1000))
+        search("filter_description", description=rng.choice(WORDS) + " " + rng.choice(WORDS))
+    for column in SORT_COLUMNS:
+        for order in ("asc", "desc"):
+            search("sort", sort_by=column, sort_order=order)
+    total = conn.execute("SELECT COUNT(*) FROM levels").fetchone()[0]
+    for fraction in (0.1, 0.5, 0.9):
+        page = max(1, int(total / 10 * fraction))
+        search("deep_page_offset", page=page)
+        search("deep_page_offset", page=page, sort_by="Size", sort_order="asc")
+    for order in ("asc", "desc"):
+        ops.append(("deep_page_cursor", f"/api/search?page_size=100&sort_by=Size&sort_order={order}&cursor_walk=20"))
+    for level_id, _, username, _ in sample[:10]:
+        ops.append(("api_export", "/api/search?" + urllib.parse.urlencode(
+            {"format": "ndjson", "username": username, "search_mode": "exclusive"})))
+
+    for level_id, *_ in sample[:100]:
+        ops.append(("download", f"/download/{level_id}"))
+    for i in range(5):
+        ids = ",".join(str(row[0]) for row in sample[i * 20:(i + 1) * 20])
+        ops.append(("download_zip", f"/downloadZip?ids={ids}"))
+    for _, _, _, songs in sample[:60]:
+        song_id = int(songs.split(",")[0])
+        category = "song_cdn" if song_id >= LIBRARY_SONG_BASE else "song_boomlings"
+        ops.append((category, f"/downloadSong/{song_id}"))
+
+    rng.shuffle(ops)
+    return ops
+
+_clients = threading.local()
+
+def run_op(url):
+    """Fetch url through the app, reading the whole body. Returns (seconds, ok)."""
+    client = getattr(_clients, "client", None)
+    if client is None:
+        client = _clients.client = browser.app.test_client()
+    started = time.perf_counter()
+    if "cursor_walk=" in url:
+        # Follow next_cursor through consecutive pages
+        url, walk = url.split("&cursor_walk=")
+        response = client.get(url)
+        ok = response.status_code == 200
+        for _ in range(int(walk) - 1):
+            cursor = response.get_json().get("next_cursor")
+            if not ok or not cursor:
+                break
+            response = client.get(url + "&" + urllib.parse.urlencode({"cursor": cursor}))
+            ok = response.status_code == 200
+    else:
+        response = client.get(url)
+        response.get_data()
+        # A level in the DB without a save file is a legitimate 404
+        ok = response.status_code == 200 or (url.startswith("/download/") and response.status_code == 404)
+    return time.perf_counter() - started, ok
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    ms = lambda v: None if v is None else round(v * 1000, 3)
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p90_ms": ms(percentile(latencies, 90)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "throughput_per_s": round(len(latencies) / elapsed, 2) if elapsed else None,
+    }
+
+# --- Helper Timings ---
+
+def time_calls(func, args_list, repeat=1):
+    latencies = []
+    for _ in range(repeat):
+        for args in args_list:
+            started = time.perf_counter()
+            func(*args)
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+def micro_benchmarks(rng, conn):
+    max_id = conn.execute("SELECT MAX(ID) FROM levels").fetchone()[0]
+    results = {}
+
+    started = time.perf_counter()
+    browser.refresh_level_index(full=True)
+    results["refresh_level_index_full_s"] = round(time.perf_counter() - started, 3)
+
+    probe = [(rng.randint(1, max_id),) for _ in range(2000)]
+    latencies = time_calls(browser.find_level_file, probe)
+    results["find_level_file"] = summarize(latencies, 0, sum(latencies))
+
+    paths = [p for p in (browser.find_level_file(level_id) for (level_id,) in probe[:200]) if p]
+    contents = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            contents.append(f.read())
+    total_bytes = sum(len(c) for c in contents)
+
+    latencies = time_calls(browser.parse_level_data, [(c,) for c in contents])
+    results["parse_level_data"] = summarize(latencies, 0, sum(latencies))
+    results["parse_level_data"]["mb_per_s"] = round(total_bytes / 1e6 / sum(latencies), 1) if latencies else None
+
+    parsed = [browser.parse_level_data(c) for c in contents]
+    latencies = time_calls(browser.make_gmd, [(p.get("1", "0"), p) for p in parsed])
+    results["make_gmd"] = summarize(latencies, 0, sum(latencies))
+    results["make_gmd"]["mb_per_s"] = round(total_bytes / 1e6 / sum(latencies), 1) if latencies else None
+    return results
+
+# --- Runner ---
+
+def reset_state():
+    """Drop every cache so runs start cold and comparable."""
+    for path in (browser.GMD_CACHE_DIR, browser.SONG_CACHE_DIR, browser.COLUMNAR_CACHE_DIR):
+        shutil.rmtree(path, ignore_errors=True)
+    for base in (browser.LEVEL_INDEX_FILE, browser.SONG_INFO_DB):
+        for path in (base, base + "-wal", base + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+    for path in browser._music_index_files():
+        os.remove(path)
+    browser.gmd_cache = browser.DiskCache(browser.GMD_CACHE_DIR, browser.GMD_CACHE_MAX_BYTES, ".gmd")
+    browser.song_cache = browser.DiskCache(browser.SONG_CACHE_DIR, browser.SONG_CACHE_MAX_BYTES, ".song")
+    browser.count_cache.clear()
+    browser.page_cache.clear()
+    browser._columnar_index = None
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(data_dir, seed, rounds, concurrency, upstream_latency):
+    os.chdir(data_dir)
+    with open("bench.json") as f:
+        dataset = json.load(f)
+
+    stub = start_stub(upstream_latency)
+    stub_url = f"http://127.0.0.1:{stub.server_port}"
+    browser.BOOMLINGS_SONG_INFO_URL = f"{stub_url}/boomlings"
+    browser.SONG_CDN_URL = stub_url + "/music/{song_id}.ogg"
+    browser.MUSIC_LIB_URL = f"{stub_url}/musiclibrary.dat"
+    browser.MUSIC_LIB_REFRESH_INTERVAL = 0
+    reset_state()
+
+    rng = random.Random(seed)
+    conn = browser.open_readonly_db()
+    micro = micro_benchmarks(rng, conn)
+    workload = build_workload(rng, conn)
+    conn.close()
+
+    latencies = {}
+    errors = {}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(rounds):
+            ops = list(workload)
+            for (category, _), (seconds, ok) in zip(ops, pool.map(lambda op: run_op(op[1]), ops)):
+                latencies.setdefault(category, []).append(seconds)
+                errors[category] = errors.get(category, 0) + (not ok)
+    elapsed = time.perf_counter() - started
+    stub.shutdown()
+
+    all_latencies = [v for values in latencies.values() for v in values]
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "dataset": dataset,
+            "seed": seed,
+            "rounds": rounds,
+            "concurrency": concurrency,
+            "upstream_latency_s": upstream_latency,
+        },
+        "total": summarize(all_latencies, sum(errors.values()), elapsed),
+        "operations": {
+            category: summarize(values, errors[category], elapsed)
+            for category, values in sorted(latencies.items())
+        },
+        "helpers": micro,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the level browser on a synthetic dataset.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="build a synthetic dataset")
+    gen.add_argument("--dir", default="bench", help="dataset directory (default: %(default)s)")
+    gen.add_argument("--levels", type=int, default=100000, help="number of levels (default: %(default)s)")
+    gen.add_argument("--seed", type=int, default=1, help="random seed (default: %(default)s)")
+    gen.add_argument("--file-ratio", type=float, default=1.0,
+                     help="fraction of levels that get a save file (default: %(default)s)")
+    gen.add_argument("--max-level-bytes", type=int, default=8 * 1024 * 1024,
+                     help="cap on a level string's size (default: %(default)s)")
+
+    bench = commands.add_parser("run", help="run the workload against a dataset")
+    bench.add_argument("--dir", default="bench", help="dataset directory (default: %(default)s)")
+    bench.add_argument("--seed", type=int, default=1, help="workload seed (default: %(default)s)")
+    bench.add_argument("--rounds", type=int, default=3, help="passes over the workload (default: %(default)s)")
+    bench.add_argument("--concurrency", type=int, default=8, help="client threads (default: %(default)s)")
+    bench.add_argument("--upstream-latency", type=float, default=0.05,
+                       help="seconds the stub upstream waits per request (default: %(default)s)")
+    bench.add_argument("--output", help="write the JSON results here instead of stdout")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        generate(args.dir, args.levels, args.seed, args.file_ratio, args.max_level_bytes)
+        return
+
+    output = os.path.abspath(args.output) if args.output else None
+    results = run(args.dir, args.seed, args.rounds, args.concurrency, args.upstream_latency)
+    text = json.dumps(results, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,173 @@
 import os
 import sqlite3
-from flask import Flask, request, render_template_string, send_file, abort, jsonify, Response
-from io import BytesIO
+import sys
+from flask import Flask, request, render_template, send_file, abort, jsonify, Response, g
 import math
 import urllib.parse
+import zipfile
 import requests
+from requests.adapters import HTTPAdapter
 import base64, zlib, os
+import contextlib
+import csv
+import hashlib
+import heapq
+import io
+import queue
+import shutil
+import itertools
+import json
+import mmap
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from email.utils import formatdate
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Paths
 DB_FILE = "levels.db"
 SAVE_DIR = "./save"
 MUSIC_LIB_URL = "https://geometrydashfiles.b-cdn.net/music/musiclibrary_02.dat"
 MUSIC_LIB_FILE = "musiclibrary.dat"
+LEVEL_INDEX_FILE = "level_files.db"
+SONG_INFO_DB = "song_info.db"
+
+# Upstream servers (point these at a local stub for testing)
+BOOMLINGS_SONG_INFO_URL = "http://www.boomlings.com/database/getGJSongInfo.php"
+SONG_CDN_URL = "https://geometrydashfiles.b-cdn.net/music/{song_id}.ogg"
+
+# Seconds between index rescans triggered by lookups that miss
+LEVEL_INDEX_MIN_REFRESH_INTERVAL = 5.0
+
+# --- Metrics ---
+# Stage timings as Prometheus histograms, byte counters and in-flight
+# gauges, served on /metrics. With SERVER_TIMING on, a request's stage
+# timings are also returned in a Server-Timing header. With METRICS_ENABLED
+# off, timed() hands out a shared no-op context manager and the request
+# hooks return immediately.
+
+METRICS_ENABLED = True
+SERVER_TIMING = False
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _label(name, value):
+    value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'{name}="{value}"'
+
+class Histogram:
+    """Latency histogram with one series per value of a single label."""
+
+    def __init__(self, name, help_text, label, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}  # label value -> [per-bucket counts (last is +Inf), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(value, list(counts), total) for value, (counts, total) in self._series.items()]
+        for value, counts, total in sorted(series):
+            label = _label(self.label, value)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {total}")
+            lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return lines
+
+class Counter:
+    """Counter (or, with kind="gauge", gauge) with one series per label value."""
+
+    def __init__(self, name, help_text, label, kind="counter"):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.kind = kind
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value, amount=1):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def dec(self, label_value, amount=1):
+        self.inc(label_value, -amount)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{{{_label(self.label, value)}}} {count}" for value, count in values)
+        return lines
+
+stage_seconds = Histogram("browse_stage_duration_seconds", "Time spent in each stage of a request.", "stage")
+request_seconds = Histogram(
+    "browse_request_duration_seconds", "Time until the response body was fully sent.", "endpoint"
+)
+response_bytes = Counter("browse_response_bytes_total", "Response body bytes sent.", "endpoint")
+upstream_bytes = Counter("browse_upstream_bytes_total", "Bytes received from upstream servers.", "upstream")
+requests_in_flight = Counter("browse_requests_in_flight", "Requests being handled.", "endpoint", kind="gauge")
+upstream_in_flight = Counter(
+    "browse_upstream_in_flight", "Upstream requests in progress.", "upstream", kind="gauge"
+)
+METRICS = (stage_seconds, request_seconds, response_bytes, upstream_bytes, requests_in_flight, upstream_in_flight)
+
+# Stage timings of the request being handled on this thread (Server-Timing)
+_request_timings = threading.local()
+
+class _StageTimer:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        stage_seconds.observe(self.stage, elapsed)
+        stages = getattr(_request_timings, "stages", None)
+        if stages is not None:
+            stages[self.stage] = stages.get(self.stage, 0.0) + elapsed
+
+_NO_TIMER = contextlib.nullcontext()
+
+def timed(stage):
+    """Context manager recording how long a stage took."""
+    if not METRICS_ENABLED:
+        return _NO_TIMER
+    return _StageTimer(stage)
+
+def count_bytes(counter, label_value, chunks):
+    """Pass chunks through, adding their length to counter."""
+    for chunk in chunks:
+        counter.inc(label_value, len(chunk))
+        yield chunk
 
 # --- GMD Conversion Logic ---
 k_tag_map = [
@@ -58,13 +214,318 @@ def make_gmd(level_id, pairs):
     xml.append('</dict></plist>')
     return ''.join(xml)
 
+# --- Streaming GMD Conversion ---
+# Level strings (key 4) can be many megabytes. iter_gmd produces exactly what
+# make_gmd(level_id, parse_level_data(data)) would, but reads the file through
+# mmap, finds the wanted fields in one pass and copies them out in chunks, so
+# memory use doesn't grow with the level size.
+
+GMD_CHUNK_SIZE = 64 * 1024
+_ASCII_WHITESPACE = b" \t\n\r\x0b\x0c"
+_GMD_RAW_KEYS = {rawkey.encode() for _, rawkey, *_ in k_tag_map if rawkey != "static"}
+
+def locate_level_fields(buf, keys):
+    """Return {key: (start, end)} byte spans of the wanted keys' values.
+
+    Follows parse_level_data: 'key:value:key:value...', values cut at the
+    first ';', later duplicates win.
+    """
+    start, end = 0, len(buf)
+    while start < end and buf[start] in _ASCII_WHITESPACE:
+        start += 1
+    while end > start and buf[end - 1] in _ASCII_WHITESPACE:
+        end -= 1
+    spans = {}
+    pos = start
+    while True:
+        key_end = buf.find(b":", pos, end)
+        if key_end == -1:
+            break
+        value_start = key_end + 1
+        value_end = buf.find(b":", value_start, end)
+        if value_end == -1:
+            value_end = end
+        key = buf[pos:key_end]
+        if key in keys:
+            semicolon = buf.find(b";", value_start, value_end)
+            spans[key] = (value_start, value_end if semicolon == -1 else semicolon)
+        if value_end == end:
+            break
+        pos = value_end + 1
+    return spans
+
+def iter_gmd(level_id, file_path):
+    """Yield the .gmd plist for a level file as UTF-8 chunks."""
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        try:
+            spans = locate_level_fields(buf, _GMD_RAW_KEYS)
+            yield b'<?xml version="1.0"?><plist version="1.0" gjver="2.0"><dict>'
+            for ktag, rawkey, *staticval in k_tag_map:
+                tagtype = "s" if ktag in ("k2", "k4", "k3") else "i"
+                if rawkey == "static":
+                    yield f'<k>{ktag}</k><{tagtype}>{staticval[0]}</{tagtype}>'.encode("utf-8")
+                    continue
+                span = spans.get(rawkey.encode())
+                if span is None or span[0] == span[1]:
+                    continue
+                yield f'<k>{ktag}</k><{tagtype}>'.encode("utf-8")
+                for pos in range(span[0], span[1], GMD_CHUNK_SIZE):
+                    yield buf[pos:min(pos + GMD_CHUNK_SIZE, span[1])]
+                yield f'</{tagtype}>'.encode("utf-8")
+            yield b'</dict></plist>'
+        finally:
+            if size:
+                buf.close()
+
+# --- Level File Index ---
+# SAVE_DIR holds millions of '{ID} - name.txt' files, so walking it on every
+# download is far too slow. The ID -> path mapping is kept in a small SQLite
+# database instead, together with the mtime of every directory that was
+# scanned. A refresh only lists directories whose mtime changed (adding,
+# removing or renaming a file bumps the mtime of its parent directory), so
+# keeping the index current costs one stat() per directory. Build the index
+# ahead of time with `python browseUnlisted.py build-level-index`; otherwise
+# the first lookup that misses does it.
+
+_level_index_local = threading.local()
+_level_index_lock = threading.Lock()
+_level_index_last_refresh = None
+
+def _level_index_conn():
+    conn = getattr(_level_index_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(LEVEL_INDEX_FILE, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+              level_id TEXT PRIMARY KEY,
+              dir TEXT NOT NULL,
+              name TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS files_dir ON files(dir)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS dirs (
+              path TEXT PRIMARY KEY,
+              parent TEXT,
+              mtime_ns INTEGER NOT NULL
+            )
+        """)
+        conn.commit()
+        _level_index_local.conn = conn
+    return conn
+
+def _level_id_from_filename(filename):
+    """Return the ID part of '{ID} - name.txt', or None for other files."""
+    if not filename.endswith(".txt"):
+        return None
+    head, sep, _ = filename.partition(" - ")
+    if not sep or not head:
+        return None
+    return head
+
+def refresh_level_index(full=False):
+    """Bring the level file index up to date with SAVE_DIR.
+
+    Directories whose mtime is unchanged since the last refresh are not
+    listed again; only their known subdirectories are visited. Pass
+    full=True to rescan every directory.
+    """
+    global _level_index_last_refresh
+    with _level_index_lock:
+        conn = _level_index_conn()
+        known = {}
+        children = {}
+        for path, parent, mtime_ns in conn.execute("SELECT path, parent, mtime_ns FROM dirs"):
+            known[path] = mtime_ns
+            children.setdefault(parent, []).append(path)
+
+        root = os.path.normpath(SAVE_DIR)
+        seen = set()
+        stack = [(root, None)]
+        while stack:
+            path, parent = stack.pop()
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            seen.add(path)
+            if not full and known.get(path) == mtime_ns:
+                stack.extend((child, path) for child in children.get(path, ()))
+                continue
+
+            entries = []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((entry.path, path))
+                        else:
+                            level_id = _level_id_from_filename(entry.name)
+                            if level_id is not None:
+                                entries.append((level_id, path, entry.name))
+            except OSError:
+                continue
+            # Replace by ID: a file moved here from a directory that is
+            # rescanned later must not be dropped along with its old entry
+            conn.execute("DELETE FROM files WHERE dir = ?", (path,))
+            conn.executemany("INSERT OR REPLACE INTO files (level_id, dir, name) VALUES (?, ?, ?)", entries)
+            conn.execute(
+                "INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)",
+                (path, parent, mtime_ns)
+            )
+            # One short write transaction per directory, not one for the whole walk
+            conn.commit()
+
+        for path in known.keys() - seen:
+            conn.execute("DELETE FROM files WHERE dir = ?", (path,))
+            conn.execute("DELETE FROM dirs WHERE path = ?", (path,))
+        conn.commit()
+        _level_index_last_refresh = time.monotonic()
+
+def _lookup_level_file(level_id):
+    row = _level_index_conn().execute(
+        "SELECT dir, name FROM files WHERE level_id = ?", (level_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    path = os.path.join(row[0], row[1])
+    return path if os.path.isfile(path) else None
+
 def find_level_file(level_id):
     """Find a file like '{ID} - name.txt' in SAVE_DIR recursively."""
-    for root, _, files in os.walk(SAVE_DIR):
-        for f in files:
-            if f.startswith(f"{level_id} - ") and f.endswith(".txt"):
-                return os.path.join(root, f)
-    return None
+    level_id = str(level_id)
+    with timed("find_level_file"):
+        path = _lookup_level_file(level_id)
+    if path:
+        return path
+    # Index miss or stale entry: rescan the directories that changed, but
+    # don't let a flood of requests for unknown IDs stat the tree nonstop.
+    last = _level_index_last_refresh
+    if last is not None and time.monotonic() - last < LEVEL_INDEX_MIN_REFRESH_INTERVAL:
+        return None
+    with timed("level_index_refresh"):
+        refresh_level_index()
+    return _lookup_level_file(level_id)
+
+# --- Disk Caches ---
+
+class DiskCache:
+    """Directory of cached files with least-recently-used eviction.
+
+    Hits refresh a file's mtime, and once the files add up to more than
+    max_bytes the oldest are removed until the cache is at 90% of it (so the
+    directory isn't rescanned on every insert). A max_bytes of 0 means the
+    cache is disabled.
+    """
+
+    def __init__(self, directory, max_bytes, suffix):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._bytes = None
+        self._temp_counter = itertools.count()
+
+    def path(self, key):
+        return os.path.join(os.path.abspath(self.directory), key + self.suffix)
+
+    def lookup(self, key):
+        """Return the path of a cached entry (marking it as used), or None."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def temp_path(self, key):
+        os.makedirs(self.directory, exist_ok=True)
+        return f"{self.path(key)}.{os.getpid()}.{next(self._temp_counter)}.tmp"
+
+    def commit(self, temp_path, key):
+        """Move a fully written temp file into place and account for it."""
+        path = self.path(key)
+        size = os.path.getsize(temp_path)
+        os.replace(temp_path, path)
+        self._added(size)
+        return path
+
+    def discard(self, temp_path):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+    def _scan(self):
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(self.suffix):
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _added(self, size):
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._bytes += size
+            if self._bytes <= self.max_bytes:
+                return
+            entries = sorted(self._scan())
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * 0.9
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+            self._bytes = total
+
+# --- GMD Cache ---
+# Converted levels are kept on disk, named after the level ID plus the mtime
+# and size of the source file, so an edited level is never served stale.
+
+GMD_CACHE_DIR = "./gmd_cache"
+GMD_CACHE_MAX_BYTES = 2 * 1024**3
+# Bump when make_gmd's output changes so old conversions are not served
+GMD_FORMAT_VERSION = 1
+
+gmd_cache = DiskCache(GMD_CACHE_DIR, GMD_CACHE_MAX_BYTES, ".gmd")
+
+def gmd_cache_key(level_id, st):
+    return f"{level_id}-{st.st_mtime_ns:x}-{st.st_size:x}-v{GMD_FORMAT_VERSION}"
+
+def get_cached_gmd(level_id, file_path):
+    """Return (path of the converted .gmd, stat of the source file), converting on a miss."""
+    st = os.stat(file_path)
+    key = gmd_cache_key(level_id, st)
+    path = gmd_cache.lookup(key)
+    if path:
+        return path, st
+
+    temp_path = gmd_cache.temp_path(key)
+    try:
+        with open(temp_path, "wb") as f, timed("gmd_build"):
+            for chunk in iter_gmd(level_id, file_path):
+                f.write(chunk)
+    except BaseException:
+        gmd_cache.discard(temp_path)
+        raise
+    return gmd_cache.commit(temp_path, key), st
 
 def format_size(size_str):
     """Convert '11601 B' to readable B/KB/MB."""
@@ -88,9 +549,21 @@ def parse_size_to_int(size_str):
     except:
         return 0
 
+# --- Upstream HTTP ---
+# One shared session so connections to the CDN and Boomlings are kept alive
+# and pooled across requests; every call gets a (connect, read) timeout.
+
+HTTP_TIMEOUT = (5, 30)
+HTTP_POOL_SIZE = 32
+
+http_session = requests.Session()
+_http_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+http_session.mount("http://", _http_adapter)
+http_session.mount("https://", _http_adapter)
+
 def download_musiclibrary(file_name=MUSIC_LIB_FILE):
     if not os.path.exists(file_name):
-        r = requests.get(MUSIC_LIB_URL)
+        r = http_session.get(MUSIC_LIB_URL, timeout=HTTP_TIMEOUT)
         r.raise_for_status()
         with open(file_name, "wb") as f:
             f.write(r.content)
@@ -117,9 +590,476 @@ def parse_music_library(content):
         songs[song_id] = song_name
     return songs
 
-download_musiclibrary()
-_music_content = decode_and_inflate(MUSIC_LIB_FILE)
-MUSIC_LIBRARY = parse_music_library(_music_content)
+def music_library_version(content):
+    return content.split("|", 1)[0]
+
+# --- Compiled Music Library ---
+# Decoding and parsing musiclibrary.dat on every start is slow, so the song
+# map is compiled once into MUSIC_LIB_INDEX: a header with the library
+# version, a sorted int64 array of song IDs, an array of offsets and a blob
+# of UTF-8 names. It is mmapped and binary-searched, which makes loading it
+# instant and lets worker processes share the pages. Nothing is loaded until
+# the first song name is needed, and a background thread recompiles the index
+# when the upstream library version changes. Every compile writes a new file
+# named MUSIC_LIB_INDEX plus a generation number instead of replacing the old
+# one, since a file that is mmapped can't be replaced or deleted on Windows;
+# the newest generation is the current index.
+
+MUSIC_LIB_INDEX = "musiclibrary.idx"
+# Seconds between checks for a new upstream library; 0 disables them
+MUSIC_LIB_REFRESH_INTERVAL = 24 * 3600
+
+_MUSIC_INDEX_MAGIC = b"GDMLIDX1"
+_MUSIC_INDEX_HEADER = struct.Struct("<8sII")
+
+_music_library = None
+_music_library_lock = threading.Lock()
+_music_refresh_thread = None
+
+def _music_index_files():
+    """Compiled index files on disk, oldest generation first."""
+    stem, ext = os.path.splitext(MUSIC_LIB_INDEX)
+    directory, prefix = os.path.split(stem)
+    found = []
+    for name in os.listdir(directory or "."):
+        generation = name[len(prefix) + 1:-len(ext)]
+        if name.startswith(prefix + ".") and name.endswith(ext) and generation.isascii() and generation.isdigit():
+            found.append((int(generation), os.path.join(directory, name)))
+    return [path for _, path in sorted(found)]
+
+def compile_music_library(songs, version, index_file=None):
+    """Write a song map to the compiled index format and return its path.
+
+    Without index_file a new generation is written and older ones are removed
+    where possible (on Windows, not while a worker still has them mapped).
+    """
+    if index_file is None:
+        stem, ext = os.path.splitext(MUSIC_LIB_INDEX)
+        index_file = f"{stem}.{time.time_ns()}{ext}"
+        old_files = _music_index_files()
+    else:
+        old_files = []
+    ids = sorted(songs)
+    names = [songs[song_id].encode("utf-8") for song_id in ids]
+    offsets = [0]
+    for name in names:
+        offsets.append(offsets[-1] + len(name))
+    version_bytes = version.encode("utf-8")
+    header = _MUSIC_INDEX_HEADER.pack(_MUSIC_INDEX_MAGIC, len(version_bytes), len(ids)) + version_bytes
+    header += b"\0" * (-len(header) % 8)
+
+    temp_path = f"{index_file}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(array("q", ids).tobytes())
+        f.write(array("Q", offsets).tobytes())
+        f.write(b"".join(names))
+    os.replace(temp_path, index_file)
+    for path in old_files:
+        with contextlib.suppress(OSError):
+            os.remove(path)
+    return index_file
+
+class MusicLibrary:
+    """Read-only view of a compiled music library index."""
+
+    def __init__(self, index_file):
+        with open(index_file, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = index_file
+        magic, version_len, count = _MUSIC_INDEX_HEADER.unpack_from(self._mm, 0)
+        if magic != _MUSIC_INDEX_MAGIC:
+            raise ValueError(f"{index_file} is not a compiled music library")
+        pos = _MUSIC_INDEX_HEADER.size
+        self.version = self._mm[pos:pos + version_len].decode("utf-8")
+        pos += version_len
+        pos += -pos % 8
+        view = memoryview(self._mm)
+        self._ids = view[pos:pos + 8 * count].cast("q")
+        pos += 8 * count
+        self._offsets = view[pos:pos + 8 * (count + 1)].cast("Q")
+        self._names_start = pos + 8 * (count + 1)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get(self, song_id, default=None):
+        i = bisect_left(self._ids, song_id)
+        if i == len(self._ids) or self._ids[i] != song_id:
+            return default
+        start = self._names_start + self._offsets[i]
+        end = self._names_start + self._offsets[i + 1]
+        return self._mm[start:end].decode("utf-8")
+
+def _compile_from_dat():
+    content = decode_and_inflate(MUSIC_LIB_FILE)
+    return compile_music_library(parse_music_library(content), music_library_version(content))
+
+def get_music_library():
+    """Return the song map, compiling (and if needed downloading) it on first use."""
+    global _music_library
+    library = _music_library
+    if library is not None:
+        return library
+    with _music_library_lock:
+        if _music_library is None:
+            files = _music_index_files()
+            if not files:
+                download_musiclibrary(MUSIC_LIB_FILE)
+                files = [_compile_from_dat()]
+            _music_library = MusicLibrary(files[-1])
+            _start_music_refresh()
+        return _music_library
+
+def refresh_music_library():
+    """Fetch the upstream library if it changed and recompile on a new version."""
+    global _music_library
+    headers = {}
+    if os.path.exists(MUSIC_LIB_FILE):
+        headers["If-Modified-Since"] = formatdate(os.path.getmtime(MUSIC_LIB_FILE), usegmt=True)
+    r = http_session.get(MUSIC_LIB_URL, headers=headers, timeout=HTTP_TIMEOUT)
+    if r.status_code != 304:
+        r.raise_for_status()
+        content = zlib.decompress(base64.urlsafe_b64decode(r.content)).decode("utf-8")
+        version = music_library_version(content)
+        changed = version != (_music_library.version if _music_library else None)
+        if changed or not os.path.exists(MUSIC_LIB_FILE):
+            temp_path = f"{MUSIC_LIB_FILE}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(r.content)
+            os.replace(temp_path, MUSIC_LIB_FILE)
+        else:
+            os.utime(MUSIC_LIB_FILE)
+        if changed:
+            compile_music_library(parse_music_library(content), version)
+    # Pick up an index recompiled by this or another worker process
+    files = _music_index_files()
+    if files and (_music_library is None or _music_library.path != files[-1]):
+        _music_library = MusicLibrary(files[-1])
+
+def _music_refresh_loop():
+    while True:
+        time.sleep(MUSIC_LIB_REFRESH_INTERVAL)
+        try:
+            refresh_music_library()
+        except Exception as e:
+            print(f"Music library refresh failed: {e}")
+
+def _start_music_refresh():
+    global _music_refresh_thread
+    if MUSIC_LIB_REFRESH_INTERVAL and _music_refresh_thread is None:
+        _music_refresh_thread = threading.Thread(
+            target=_music_refresh_loop, name="music-library-refresh", daemon=True
+        )
+        _music_refresh_thread.start()
+
+# --- Database Migrations ---
+# The levels table stores numbers as loosely typed text ('11601 B', '' for
+# unknown values), so filtering on them means casting every row. migrate_db()
+# adds typed, indexed generated columns for those fields; SQLite keeps them
+# current on every insert/update. The query builder uses them when present
+# and falls back to the equivalent expressions on an unmigrated database.
+
+NUMERIC_COLUMNS = {
+    "Size": ("SizeBytes", "CAST(REPLACE(Size,' B','') AS INTEGER)"),
+    "CreatorPoints": ("CreatorPointsNum", "CAST(NULLIF(CreatorPoints,'') AS INTEGER)"),
+    "EditorTime": ("EditorTimeNum", "CAST(NULLIF(EditorTime,'') AS INTEGER)"),
+    "EditorCTime": ("EditorCTimeNum", "CAST(NULLIF(EditorCTime,'') AS INTEGER)"),
+    "ObjectCount": ("ObjectCountNum", "CAST(NULLIF(ObjectCount,'') AS INTEGER)"),
+    "rCoins": ("rCoinsNum", "CAST(NULLIF(rCoins,'') AS INTEGER)"),
+    "sCoins": ("sCoinsNum", "CAST(NULLIF(sCoins,'') AS INTEGER)"),
+}
+
+# Index name -> indexed columns. The sortable columns carry ID so that
+# "ORDER BY x, ID" can be read straight off the index.
+NUMERIC_INDEXES = {
+    "idx_levels_size": "SizeBytes, ID",
+    "idx_levels_cp": "CreatorPointsNum, ID",
+    "idx_levels_editortime": "EditorTimeNum",
+    "idx_levels_editorctime": "EditorCTimeNum",
+    "idx_levels_objectcount": "ObjectCountNum",
+    "idx_levels_rcoins": "rCoinsNum",
+    "idx_levels_scoins": "sCoinsNum",
+}
+
+# Trigram full-text index over the free-text fields, used to narrow
+# "contains" and case-insensitive searches before the exact LIKE/= check.
+# It is an external-content table, so it only stores the index; triggers
+# keep it in step with levels.
+ENABLE_FTS = True
+FTS_COLUMNS = ("Name", "Username", "Description")
+
+FTS_TRIGGERS = {
+    "levels_fts_ai": """
+        CREATE TRIGGER IF NOT EXISTS levels_fts_ai AFTER INSERT ON levels BEGIN
+          INSERT INTO levels_fts(rowid, Name, Username, Description)
+          VALUES (new.rowid, new.Name, new.Username, new.Description);
+        END
+    """,
+    "levels_fts_ad": """
+        CREATE TRIGGER IF NOT EXISTS levels_fts_ad AFTER DELETE ON levels BEGIN
+          INSERT INTO levels_fts(levels_fts, rowid, Name, Username, Description)
+          VALUES ('delete', old.rowid, old.Name, old.Username, old.Description);
+        END
+    """,
+    "levels_fts_au": """
+        CREATE TRIGGER IF NOT EXISTS levels_fts_au AFTER UPDATE OF Name, Username, Description ON levels BEGIN
+          INSERT INTO levels_fts(levels_fts, rowid, Name, Username, Description)
+          VALUES ('delete', old.rowid, old.Name, old.Username, old.Description);
+          INSERT INTO levels_fts(rowid, Name, Username, Description)
+          VALUES (new.rowid, new.Name, new.Username, new.Description);
+        END
+    """,
+}
+
+# One row per (level, song) pair, split out of the comma-separated songID
+# column so song filters and "levels using this song" counts are index
+# lookups. json_each() does the splitting (triggers can't use CTEs): the
+# quoted songID with every comma turned into '","' is always a valid JSON
+# array of the parts. Only parts written as plain integers are kept, so
+# '9,' or '1,,2' still list their songs; anything else ('01', ' 7') is left
+# to the LIKE fallback in build_where, as before.
+SONG_IDS_SELECT = """
+    SELECT {row}.ID, CAST(value AS INTEGER)
+    FROM {tables}json_each('[' || replace(json_quote(CAST({row}.songID AS TEXT)), ',', '","') || ']')
+    WHERE value = CAST(CAST(value AS INTEGER) AS TEXT)
+"""
+
+LEVEL_SONGS_TRIGGERS = {
+    "level_songs_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS level_songs_ai AFTER INSERT ON levels BEGIN
+          -- INSERT OR REPLACE deletes the old row without firing level_songs_ad
+          DELETE FROM level_songs WHERE level_id = new.ID;
+          INSERT OR IGNORE INTO level_songs(level_id, song_id) {SONG_IDS_SELECT.format(row="new", tables="")};
+        END
+    """,
+    "level_songs_ad": """
+        CREATE TRIGGER IF NOT EXISTS level_songs_ad AFTER DELETE ON levels BEGIN
+          DELETE FROM level_songs WHERE level_id = old.ID;
+        END
+    """,
+    "level_songs_au": f"""
+        CREATE TRIGGER IF NOT EXISTS level_songs_au AFTER UPDATE OF ID, songID ON levels BEGIN
+          DELETE FROM level_songs WHERE level_id = old.ID;
+          INSERT OR IGNORE INTO level_songs(level_id, song_id) {SONG_IDS_SELECT.format(row="new", tables="")};
+        END
+    """,
+}
+
+# Facet counts (levels per value of the fields below) for the results
+# page. The counts over the whole table are kept in level_facets by
+# triggers; a filtered search counts its matches in one grouped pass when
+# there are at most FACET_SCAN_MAX_ROWS of them.
+FACET_FIELDS = {
+    # field -> (query arg, value expression on a levels row)
+    "Length": ("length", "COALESCE({0}.Length, '')"),
+    "Version": ("version", "COALESCE({0}.Version, '')"),
+    "TwoPlayer": ("two_player", "COALESCE({0}.TwoPlayer, '')"),
+    "rCoins": ("rcoins", "COALESCE(CAST(NULLIF({0}.rCoins,'') AS INTEGER), '')"),
+    "sCoins": ("scoins", "COALESCE(CAST(NULLIF({0}.sCoins,'') AS INTEGER), '')"),
+    "RequestedRating": ("requested_rating", "COALESCE({0}.RequestedRating, '')"),
+}
+FACET_SCAN_MAX_ROWS = 100000
+LENGTH_ORDER = ("Tiny", "Short", "Medium", "Long", "XL", "Platformer")
+
+def _facet_rows(row):
+    return " UNION ALL ".join(
+        f"SELECT '{field}' AS field, {expr.format(row)} AS value"
+        for field, (_, expr) in FACET_FIELDS.items()
+    )
+
+# No upserts or OR IGNORE here: a conflict clause on the statement that
+# fires a trigger (INSERT OR REPLACE INTO levels) overrides the trigger's own.
+def _facet_add(row):
+    return f"""
+          INSERT INTO level_facets(field, value, count)
+          SELECT field, value, 0 FROM ({_facet_rows(row)}) AS v
+          WHERE NOT EXISTS (SELECT 1 FROM level_facets f WHERE f.field = v.field AND f.value = v.value);
+          UPDATE level_facets SET count = count + 1 WHERE (field, value) IN ({_facet_rows(row)});
+    """
+
+def _facet_remove(row):
+    return f"""
+          UPDATE level_facets SET count = count - 1 WHERE (field, value) IN ({_facet_rows(row)});
+          DELETE FROM level_facets WHERE count <= 0 AND (field, value) IN ({_facet_rows(row)});
+    """
+
+FACET_TRIGGERS = {
+    "level_facets_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS level_facets_ai AFTER INSERT ON levels BEGIN
+          {_facet_add("new")}
+        END
+    """,
+    "level_facets_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS level_facets_ad AFTER DELETE ON levels BEGIN
+          {_facet_remove("old")}
+        END
+    """,
+    "level_facets_au": f"""
+        CREATE TRIGGER IF NOT EXISTS level_facets_au
+        AFTER UPDATE OF {", ".join(FACET_FIELDS)} ON levels BEGIN
+          {_facet_remove("old")}
+          {_facet_add("new")}
+        END
+    """,
+}
+
+_schema_cache = {}
+
+def db_schema(cur):
+    """Return (levels column names incl. generated ones, table names) for cur's database."""
+    schema_version = cur.execute("PRAGMA schema_version").fetchone()[0]
+    db_path = cur.execute("PRAGMA database_list").fetchone()[2]
+    cached = _schema_cache.get(db_path)
+    if cached is None or cached[0] != schema_version:
+        columns = {row[1] for row in cur.execute("PRAGMA table_xinfo(levels)")}
+        tables = {row[0] for row in cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        cached = _schema_cache[db_path] = (schema_version, (columns, tables))
+    return cached[1]
+
+def numeric_column(field, columns):
+    """SQL for the integer value of a numeric field, NULL where it's empty."""
+    shadow, expr = NUMERIC_COLUMNS[field]
+    return shadow if shadow in columns else expr
+
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+
+def parse_int(value):
+    """int(value) clamped to SQLite's 64-bit integers, or None if it isn't a number."""
+    try:
+        return min(max(int(value), INT64_MIN), INT64_MAX)
+    except (TypeError, ValueError):
+        return None
+
+def migrate_db(db_file=None):
+    """Add the typed shadow columns and their indexes to levels.db."""
+    conn = sqlite3.connect(db_file or DB_FILE, timeout=60)
+    try:
+        columns = {row[1] for row in conn.execute("PRAGMA table_xinfo(levels)")}
+        for shadow, expr in NUMERIC_COLUMNS.values():
+            if shadow not in columns:
+                try:
+                    conn.execute(
+                        f"ALTER TABLE levels ADD COLUMN {shadow} INTEGER GENERATED ALWAYS AS ({expr}) VIRTUAL"
+                    )
+                except sqlite3.OperationalError as e:
+                    # SQLite older than 3.31: queries keep using the CAST expressions
+                    print(f"Typed columns not available: {e}")
+                    break
+                columns.add(shadow)
+        for index_name, index_columns in NUMERIC_INDEXES.items():
+            if all(column.strip() in columns for column in index_columns.split(",")):
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON levels({index_columns})")
+        _migrate_level_songs(conn)
+        _migrate_facets(conn)
+        if ENABLE_FTS:
+            _migrate_fts(conn)
+        conn.execute("PRAGMA optimize")
+        conn.commit()
+    finally:
+        conn.close()
+
+def _trigger_changed(conn, name, trigger_sql):
+    """True if the database has an older definition of the trigger."""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)).fetchone()
+    expected = trigger_sql.replace("IF NOT EXISTS ", "", 1)
+    return row is not None and row[0].split() != expected.split()
+
+def _migrate_level_songs(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'level_songs'"
+    ).fetchone()
+    if not exists:
+        conn.execute("""
+            CREATE TABLE level_songs (
+              level_id INTEGER NOT NULL,
+              song_id INTEGER NOT NULL,
+              PRIMARY KEY (level_id, song_id)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX level_songs_song ON level_songs(song_id, level_id)")
+    outdated = [
+        name for name, trigger_sql in LEVEL_SONGS_TRIGGERS.items() if _trigger_changed(conn, name, trigger_sql)
+    ]
+    if not exists or outdated:
+        # New table, or one kept by older triggers (which missed songs of
+        # replaced rows and of songIDs that weren't a clean list)
+        for name in outdated:
+            conn.execute(f"DROP TRIGGER {name}")
+        conn.execute("DELETE FROM level_songs")
+        conn.execute(
+            "INSERT OR IGNORE INTO level_songs(level_id, song_id) "
+            + SONG_IDS_SELECT.format(row="levels", tables="levels, ")
+        )
+    for trigger_sql in LEVEL_SONGS_TRIGGERS.values():
+        conn.execute(trigger_sql)
+
+def _migrate_facets(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'level_facets'"
+    ).fetchone()
+    if not exists:
+        conn.execute("""
+            CREATE TABLE level_facets (
+              field TEXT NOT NULL,
+              value,
+              count INTEGER NOT NULL,
+              PRIMARY KEY (field, value)
+            ) WITHOUT ROWID
+        """)
+        for field, (_, expr) in FACET_FIELDS.items():
+            conn.execute(f"""
+                INSERT INTO level_facets(field, value, count)
+                SELECT '{field}', {expr.format("levels")}, COUNT(*) FROM levels GROUP BY 2
+            """)
+    for trigger_sql in FACET_TRIGGERS.values():
+        conn.execute(trigger_sql)
+
+def _migrate_fts(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'levels_fts'"
+    ).fetchone()
+    if not exists:
+        try:
+            conn.execute(f"""
+                CREATE VIRTUAL TABLE levels_fts USING fts5(
+                  {", ".join(FTS_COLUMNS)}, content='levels', tokenize='trigram'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            # SQLite built without FTS5 or older than 3.34 (no trigram tokenizer)
+            print(f"Full-text index not available: {e}")
+            return False
+    for trigger_sql in FTS_TRIGGERS.values():
+        conn.execute(trigger_sql)
+    if not exists:
+        conn.execute("INSERT INTO levels_fts(levels_fts) VALUES ('rebuild')")
+    return True
+
+def rebuild_fts(db_file=None):
+    """Rebuild the full-text index from scratch, e.g. after a bulk load with triggers off."""
+    conn = sqlite3.connect(db_file or DB_FILE, timeout=60)
+    try:
+        if _migrate_fts(conn):
+            conn.execute("INSERT INTO levels_fts(levels_fts) VALUES ('rebuild')")
+        conn.commit()
+    finally:
+        conn.close()
+
+def rebuild_facets(db_file=None):
+    """Recount level_facets, e.g. after INSERT OR REPLACE writes (their
+    implicit deletes don't fire the delete trigger)."""
+    conn = sqlite3.connect(db_file or DB_FILE, timeout=60)
+    try:
+        conn.execute("DROP TABLE IF EXISTS level_facets")
+        _migrate_facets(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+def fts_phrase(value):
+    """Quote a search string as an FTS5 phrase."""
+    return '"' + value.replace('"', '""') + '"'
 
 # --- Flask App ---
 app = Flask(__name__)
@@ -141,9 +1081,17 @@ HTML = """
     .card p { margin: 0.3em 0; }
     .download-btn { display: inline-block; margin-top: 0.5em; padding: 0.4em 0.8em; background: #28a745; color: white; text-decoration: none; border-radius: 5px; }
     .download-btn:hover { background: #1e7e34; }
+    .song-uses { color: #6c757d; font-size: 0.85em; text-decoration: none; }
+    .facets { margin-bottom: 1em; font-size: 0.9em; }
+    .facets p { margin: 0.3em 0; }
+    .facets a { color: #007bff; text-decoration: none; }
+    .facet-count { color: #6c757d; }
     .pagination { margin-top: 1em; }
     .pagination form { display: inline; }
     .pagination input[type="number"] { width: 50px; }
+    .page-link { display: inline-block; padding: 0.5em; margin: 0.3em; border-radius: 6px; background: #007bff; color: white; text-decoration: none; }
+    .page-link:hover { background: #0056b3; }
+    .page-link.disabled { background: #adb5bd; }
 
     /* (i) info button + panel */
     .info-btn { position: absolute; top: 6px; right: 8px; background: none; border: none; cursor: pointer; font-weight: bold; color: #007bff; }
@@ -215,6 +1163,15 @@ HTML = """
   </form>
 
   {% if results %}
+  {% if facets %}
+  <div class="facets">
+    {% for field, links in facets %}
+    <p><b>{{field}}:</b>
+      {% for value, count, query in links %}<a href="/?{{query}}">{{value}}</a> <span class="facet-count">({{count}})</span>{% if not loop.last %} &middot; {% endif %}{% endfor %}
+    </p>
+    {% endfor %}
+  </div>
+  {% endif %}
   <div class="results">
     {% for row in results %}
     <div class="card">
@@ -226,7 +1183,8 @@ HTML = """
       <p><b>Description:</b> {{row[4]}}</p>
       <p><b>Song IDs:</b> 
         {% for song_id in row[6].split(",") %}
-          <a href="/downloadSong/{{ song_id|trim }}">{{ song_id|trim }}</a>{% if not loop.last %}, {% endif %}
+          {% set sid = song_id|trim %}
+          <a href="/downloadSong/{{ sid }}">{{ sid }}</a>{% if song_counts.get(sid) %} <a class="song-uses" href="/?song_id={{ sid }}" title="Levels using this song">({{ song_counts[sid] }})</a>{% endif %}{% if not loop.last %}, {% endif %}
         {% endfor %}
       </p>
       <p><b>Size:</b> {{row[5]}}</p>
@@ -249,35 +1207,31 @@ HTML = """
   </div>
 
   <div class="pagination">
-    <form method="get" style="display:inline;">
-      {% for key, value in request.args.items() %}
-        {% if key != "page" %}
-          <input type="hidden" name="{{key}}" value="{{value}}">
-        {% endif %}
-      {% endfor %}
-      <button type="submit" name="page" value="{{page-1}}" {% if page <= 1 %}disabled{% endif %}>Previous</button>
-    </form>
+    {% if page > 1 %}
+      <a class="page-link" href="?{{ base_query }}{% if base_query %}&{% endif %}page={{page-1}}{% if prev_cursor %}&cursor={{prev_cursor}}{% endif %}">Previous</a>
+    {% else %}
+      <span class="page-link disabled">Previous</span>
+    {% endif %}
 
     Page <form method="get" style="display:inline;">
       <input type="number" name="page" value="{{page}}" min="1" max="{{total_pages}}">
-      {% for key, value in request.args.items() %}
-        {% if key != "page" %}
-          <input type="hidden" name="{{key}}" value="{{value}}">
-        {% endif %}
+      {% for key, value in hidden_args %}
+        <input type="hidden" name="{{key}}" value="{{value}}">
       {% endfor %}
       <button type="submit">Go</button>
     </form>
 
-    <form method="get" style="display:inline;">
-      {% for key, value in request.args.items() %}
-        {% if key != "page" %}
-          <input type="hidden" name="{{key}}" value="{{value}}">
-        {% endif %}
-      {% endfor %}
-      <button type="submit" name="page" value="{{page+1}}" {% if page >= total_pages %}disabled{% endif %}>Next</button>
-    </form>
+    {% if page < total_pages %}
+      <a class="page-link" href="?{{ base_query }}{% if base_query %}&{% endif %}page={{page+1}}{% if next_cursor %}&cursor={{next_cursor}}{% endif %}">Next</a>
+    {% else %}
+      <span class="page-link disabled">Next</span>
+    {% endif %}
 
     <p>Page {{page}} of {{total_pages}}</p>
+    <p>
+      <a href="/downloadZip?ids={% for row in results %}{{row[0]}}{% if not loop.last %},{% endif %}{% endfor %}">Download this page (ZIP)</a>
+      | <a href="/downloadZip?{{ base_query }}">Download all results (ZIP)</a>
+    </p>
   </div>
 
   {% elif searched %}
@@ -287,31 +1241,376 @@ HTML = """
 </html>
 """
 
-def search_levels(level_id, name, username, description, song_id, min_cp, max_cp,
-                  min_size, max_size, search_mode, case_sensitive,
-                  sort_by, sort_order, page, page_size,
-                  original_id, rcoins, scoins, version, length,
-                  min_editor_time, max_editor_time, editor_ctime,
-                  requested_rating, two_player, min_object_count, max_object_count):
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
+# --- Request Metrics ---
+
+@app.before_request
+def _start_request_metrics():
+    if not METRICS_ENABLED:
+        return
+    endpoint = request.endpoint or "unmatched"
+    requests_in_flight.inc(endpoint)
+    _request_timings.started = time.perf_counter()
+    _request_timings.stages = {} if SERVER_TIMING else None
+
+@app.after_request
+def _finish_request_metrics(response):
+    if not METRICS_ENABLED:
+        return response
+    endpoint = request.endpoint or "unmatched"
+    started = _request_timings.started
+    stages = _request_timings.stages
+    # finish() below takes over; _abandon_request_metrics skips this request
+    _request_timings.started = None
+    _request_timings.stages = None
+    if stages is not None:
+        stages["app"] = time.perf_counter() - started
+        response.headers["Server-Timing"] = ", ".join(
+            f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in stages.items()
+        )
+
+    if response.content_length is not None:
+        response_bytes.inc(endpoint, response.content_length)
+    elif not response.direct_passthrough:
+        response.response = count_bytes(response_bytes, endpoint, response.response)
+
+    def finish():
+        request_seconds.observe(endpoint, time.perf_counter() - started)
+        requests_in_flight.dec(endpoint)
+    if response.direct_passthrough:
+        # send_file: the server writes the file itself and never calls close callbacks
+        finish()
+    else:
+        # Streamed bodies are still being sent here, so finish once the server closes the response
+        response.call_on_close(finish)
+    return response
+
+@app.teardown_request
+def _abandon_request_metrics(error=None):
+    # after_request is skipped when an exception propagates (debug mode,
+    # PROPAGATE_EXCEPTIONS), so finish such requests here
+    started = getattr(_request_timings, "started", None)
+    if started is None:
+        return
+    _request_timings.started = None
+    _request_timings.stages = None
+    endpoint = request.endpoint or "unmatched"
+    request_seconds.observe(endpoint, time.perf_counter() - started)
+    requests_in_flight.dec(endpoint)
 
-    select_sql = """
-        SELECT
-          ID, Name, Username, CreatorPoints, Description, Size, songID,
-          OriginalID, rCoins, sCoins, Version, Length, EditorTime, EditorCTime,
-          RequestedRating, TwoPlayer, ObjectCount
-        FROM levels
-        WHERE 1=1
+@app.route("/metrics")
+def metrics():
+    if not METRICS_ENABLED:
+        abort(404)
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+# --- Caching ---
+
+COUNT_CACHE_MAX_BYTES = 4 * 1024**2
+
+def db_version():
+    """Cheap fingerprint of levels.db (or its shards) that changes whenever it is written or replaced."""
+    version = []
+    for path in (path for db_file in db_files() for path in (db_file, db_file + "-wal")):
+        try:
+            st = os.stat(path)
+        except OSError:
+            version.append(None)
+            continue
+        version.append((st.st_ino, st.st_mtime_ns, st.st_size))
+    return tuple(version)
+
+class LRUCache:
+    """Thread-safe LRU map bounded by the summed size of its entries.
+
+    Every lookup passes the current data version; when it differs from the
+    version the cache was filled under, all entries are dropped.
     """
 
+    ENTRY_OVERHEAD = 200
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.version = None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _check_version(self, version):
+        if version != self.version:
+            self._entries.clear()
+            self._bytes = 0
+            self.version = version
+
+    def get(self, key, version):
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, version, size=0):
+        size += self.ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_version(version)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+# Normalized filter (WHERE clause + parameters) -> total result count
+count_cache = LRUCache(COUNT_CACHE_MAX_BYTES)
+
+# --- Database Connections ---
+# Each worker thread keeps one long-lived read-only connection, so SQLite's
+# page cache and the prepared statement cache survive between requests. The
+# connection is reopened when levels.db is replaced (new inode), e.g. after
+# building a fresh database and renaming it into place.
+
+SQLITE_MMAP_SIZE = 256 * 1024**2
+SQLITE_CACHE_SIZE_KIB = 64 * 1024
+SQLITE_STATEMENT_CACHE = 256
+
+_db_local = threading.local()
+
+def _db_identity(db_file):
+    try:
+        st = os.stat(db_file)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+def open_readonly_db(db_file=None):
+    """Open a tuned read-only connection to levels.db (or another database file)."""
+    path = os.path.abspath(db_file or DB_FILE)
+    conn = sqlite3.connect(
+        f"file:{urllib.parse.quote(path)}?mode=ro", uri=True,
+        cached_statements=SQLITE_STATEMENT_CACHE
+    )
+    conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    # No implicit transactions: on a WAL database every query then reads the
+    # latest commit and no snapshot is held open to stall checkpoints.
+    conn.isolation_level = None
+    return conn
+
+def get_db(db_file=None):
+    """Return this thread's read-only connection to levels.db (or a shard)."""
+    db_file = db_file or DB_FILE
+    conns = getattr(_db_local, "conns", None)
+    if conns is None:
+        conns = _db_local.conns = {}
+    identity = _db_identity(db_file)
+    entry = conns.get(db_file)
+    if entry is not None and entry[1] != identity:
+        entry[0].close()
+        entry = None
+    if entry is None:
+        entry = conns[db_file] = (open_readonly_db(db_file), identity)
+    return entry[0]
+
+# --- Shards ---
+# The catalogue can be split by ID range into DB_SHARD_COUNT files named
+# after DB_SHARD_PATTERN ('python browseUnlisted.py shard N' builds them from
+# levels.db). Queries then run on every shard at once in a thread pool;
+# sqlite3 releases the GIL while a statement runs, so scans use all cores.
+# Sorted pages are k-way merged on (sort key, ID) and counts summed. With
+# DB_SHARD_COUNT = 0 everything reads DB_FILE directly.
+
+DB_SHARD_COUNT = 0
+DB_SHARD_PATTERN = "levels.shard{:02d}.db"
+SHARD_WORKERS = os.cpu_count() or 4
+
+_shard_executor = None
+_shard_executor_lock = threading.Lock()
+
+def db_files():
+    """The database files holding the levels table."""
+    if DB_SHARD_COUNT:
+        return [DB_SHARD_PATTERN.format(i) for i in range(DB_SHARD_COUNT)]
+    return [DB_FILE]
+
+def _get_shard_executor():
+    global _shard_executor
+    with _shard_executor_lock:
+        if _shard_executor is None:
+            _shard_executor = ThreadPoolExecutor(max_workers=SHARD_WORKERS, thread_name_prefix="shard")
+        return _shard_executor
+
+def on_shards(func, *args):
+    """Return [func(db_file, *args) for every database file], run in parallel when sharded."""
+    files = db_files()
+    if len(files) == 1:
+        return [func(files[0], *args)]
+    with timed("db_shards"):
+        return list(_get_shard_executor().map(lambda db_file: func(db_file, *args), files))
+
+def merge_sorted(row_lists, key_index, sort_order):
+    """Merge row lists that are each in result order (row[key_index] is the sort key, row[0] the ID)."""
+    def key(row):
+        value = row[key_index]
+        # SQLite puts NULL before every number
+        return (value is not None, 0 if value is None else value, row[0])
+    return heapq.merge(*row_lists, key=key, reverse=(sort_order != "asc"))
+
+def shard_db(count, db_file=None):
+    """Split levels.db into count shard files of about the same number of levels, by ID range."""
+    source = os.path.abspath(db_file or DB_FILE)
+    conn = sqlite3.connect(source, timeout=60)
+    try:
+        total = conn.execute("SELECT COUNT(*) FROM levels").fetchone()[0]
+        bounds = [None]
+        for i in range(1, count):
+            row = conn.execute("SELECT ID FROM levels ORDER BY ID LIMIT 1 OFFSET ?", (i * total // count,)).fetchone()
+            bounds.append(row[0] if row else None)
+        bounds.append(None)
+        create_sql = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'levels'"
+        ).fetchone()[0]
+        # Stored columns only; generated ones are recomputed in the shard
+        columns = ", ".join(row[1] for row in conn.execute("PRAGMA table_xinfo(levels)") if row[6] == 0)
+    finally:
+        conn.close()
+
+    for i in range(count):
+        path = DB_SHARD_PATTERN.format(i)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        low, high = bounds[i], bounds[i + 1]
+        shard = sqlite3.connect(temp_path)
+        try:
+            shard.execute(create_sql)
+            shard.execute("ATTACH DATABASE ? AS source", (source,))
+            shard.execute(
+                f"INSERT INTO levels ({columns}) SELECT {columns} FROM source.levels "
+                "WHERE (?1 IS NULL OR ID >= ?1) AND (?2 IS NULL OR ID < ?2)",
+                (low, high)
+            )
+            shard.commit()
+            shard.execute("DETACH DATABASE source")
+        finally:
+            shard.close()
+        migrate_db(temp_path)
+        os.replace(temp_path, path)
+        print(f"{path}: IDs {low if low is not None else '-inf'} to {high if high is not None else 'inf'}")
+
+# --- Pagination Cursors ---
+# A cursor names the row a page starts after (or, going backwards, ends
+# before) by its (sort key, ID), so any page costs an index seek instead of
+# generating and discarding every earlier row. The token is opaque to the
+# client and tied to the sort it was made for.
+
+def encode_cursor(sort_by, sort_order, before, key, level_id):
+    raw = json.dumps([sort_by, sort_order, int(before), key, level_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(token, sort_by, sort_order):
+    """Return (before, key, ID) for a token made for this sort, else None."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        token_sort_by, token_sort_order, before, key, level_id = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if (token_sort_by, token_sort_order) != (sort_by, sort_order):
+        return None
+    # Tokens come from the client: the ID and (integer or NULL) sort key must
+    # be values SQLite can bind, else the page falls back to OFFSET
+    if type(level_id) is not int or not INT64_MIN <= level_id <= INT64_MAX:
+        return None
+    if key is not None and (type(key) is not int or not INT64_MIN <= key <= INT64_MAX):
+        return None
+    return bool(before), key, level_id
+
+def keyset_predicates(sort_key, key, level_id, greater):
+    """SQL selecting rows after (greater=True) or before (key, ID) in ascending order.
+
+    Returns [(predicate, params)] to be queried one after another, in the
+    order the rows are read, each a plain index range (an OR of them can't
+    use the index). SQLite sorts NULL keys first.
+    """
+    if sort_key == "ID":
+        return [("ID > ?" if greater else "ID < ?", [level_id])]
+    if key is None:
+        if greater:
+            return [(f"{sort_key} IS NULL AND ID > ?", [level_id]), (f"{sort_key} IS NOT NULL", [])]
+        return [(f"{sort_key} IS NULL AND ID < ?", [level_id])]
+    # Rows tied with the cursor key first, then the rest of the range:
+    # SQLite only seeks on the key of a (key, ID) row-value comparison
+    if greater:
+        return [(f"{sort_key} = ? AND ID > ?", [key, level_id]), (f"{sort_key} > ?", [key])]
+    return [
+        (f"{sort_key} = ? AND ID < ?", [key, level_id]),
+        (f"{sort_key} < ?", [key]),
+        (f"{sort_key} IS NULL", []),
+    ]
+
+def resolve_sort(columns, sort_by, sort_order):
+    """Normalize the sort options and return (sort_by, SQL sort key, sort_order).
+
+    Results are always ordered by ID after the sort key, which keeps pages
+    stable and lets them be addressed by a (sort key, ID) cursor.
+    """
+    if sort_by in ("Size", "CreatorPoints"):
+        sort_key = numeric_column(sort_by, columns)
+    else:
+        sort_by, sort_key = "ID", "ID"
+    sort_order = "asc" if sort_order == "asc" else "desc"
+    return sort_by, sort_key, sort_order
+
+def order_by_sql(sort_key, sort_order):
+    direction = "ASC" if sort_order == "asc" else "DESC"
+    if sort_key == "ID":
+        return f" ORDER BY ID {direction}"
+    return f" ORDER BY {sort_key} {direction}, ID {direction}"
+
+def build_where(cur, level_id, name, username, description, song_id, min_cp, max_cp,
+                min_size, max_size, search_mode, case_sensitive,
+                original_id, rcoins, scoins, version, length,
+                min_editor_time, max_editor_time, editor_ctime,
+                requested_rating, two_player, min_object_count, max_object_count):
+    """Translate the search filters into an SQL fragment (" AND ...") and its parameters."""
+    columns, tables = db_schema(cur)
+
     where = []
     params = []
 
     # Helper functions
+    fts_terms = []
+
+    def fts_filter(field, value, pattern=False):
+        # Narrow the candidates through the trigram index. The original
+        # predicate is still applied, so this can only drop non-matches.
+        # Trigrams need at least 3 characters, and LIKE wildcards in the
+        # value can't be expressed as a phrase.
+        if "levels_fts" not in tables or field not in FTS_COLUMNS:
+            return
+        if len(value) < 3 or (pattern and ("%" in value or "_" in value)):
+            return
+        fts_terms.append(f"{field} : {fts_phrase(value)}")
+
     def exact_text(field, value):
         if value is None or value == "":
             return
+        fts_filter(field, value)
         if case_sensitive == "sensitive":
             where.append(f"{field} = ?")
             params.append(value)
@@ -322,6 +1621,7 @@ def search_levels(level_id, name, username, description, song_id, min_cp, max_cp
     def contains_text(field, value):
         if value is None or value == "":
             return
+        fts_filter(field, value, pattern=True)
         if case_sensitive == "sensitive":
             where.append(f"{field} LIKE ?")
             params.append(f"%{value}%")
@@ -339,25 +1639,32 @@ def search_levels(level_id, name, username, description, song_id, min_cp, max_cp
             contains_text(field, value)
 
     def exact_num(field, value):
-        if value is None or value == "":
+        value = parse_int(value)
+        if value is None:
             return
-        where.append(f"{field} != '' AND {field} = ?")
+        where.append(f"{numeric_column(field, columns)} = ?")
         params.append(value)
 
     def range_min(field, value):
-        if value is None or value == "":
+        value = parse_int(value)
+        if value is None:
             return
-        where.append(f"{field} != '' AND {field} >= ?")
+        where.append(f"{numeric_column(field, columns)} >= ?")
         params.append(value)
 
     def range_max(field, value):
-        if value is None or value == "":
+        value = parse_int(value)
+        if value is None:
             return
-        where.append(f"{field} != '' AND {field} <= ?")
+        where.append(f"{numeric_column(field, columns)} <= ?")
         params.append(value)
 
     # Level ID (always exact)
-    if level_id:
+    level_number = parse_int(level_id) if level_id and level_id.strip().isdigit() else None
+    if level_number is not None:
+        where.append("ID = ?")
+        params.append(level_number)
+    elif level_id:
         if case_sensitive == "sensitive":
             where.append("CAST(ID AS TEXT) = ?")
             params.append(level_id)
@@ -370,12 +1677,28 @@ def search_levels(level_id, name, username, description, song_id, min_cp, max_cp
     text_filter("Username", username)
     text_filter("Description", description)
 
-    # Song IDs
+    if fts_terms:
+        where.append("rowid IN (SELECT rowid FROM levels_fts WHERE levels_fts MATCH ?)")
+        params.append(" AND ".join(fts_terms))
+
+    # Song IDs (a level must use every requested song)
     if song_id:
         song_ids = [s.strip() for s in song_id.split(",") if s.strip()]
+        indexed = []
         for sid in song_ids:
-            where.append("(',' || songID || ',') LIKE ?")
-            params.append(f"%,{sid},%")
+            # Only IDs written the way level_songs stores them; '01' or
+            # IDs beyond 64 bits keep the textual match
+            number = parse_int(sid)
+            if "level_songs" in tables and number is not None and str(number) == sid:
+                indexed.append(number)
+            else:
+                where.append("(',' || songID || ',') LIKE ?")
+                params.append(f"%,{sid},%")
+        if indexed:
+            where.append("ID IN (" + " INTERSECT ".join(
+                ["SELECT level_id FROM level_songs WHERE song_id = ?"] * len(indexed)
+            ) + ")")
+            params.extend(indexed)
 
     # New fields
     text_filter("OriginalID", original_id, exclusive=True)
@@ -397,36 +1720,437 @@ def search_levels(level_id, name, username, description, song_id, min_cp, max_cp
     range_max("CreatorPoints", max_cp)
 
     # Size range
-    if min_size:
-        where.append("CAST(REPLACE(Size,' B','') AS INTEGER) >= ?")
-        params.append(min_size)
-    if max_size:
-        where.append("CAST(REPLACE(Size,' B','') AS INTEGER) <= ?")
-        params.append(max_size)
+    range_min("Size", min_size)
+    range_max("Size", max_size)
+
+    where_sql = " AND " + " AND ".join(where) if where else ""
+    return where_sql, params
+
+# --- Columnar Engine ---
+# With NumPy installed, searches that only filter on numeric fields skip
+# SQLite: the typed values of those fields are kept as arrays in .npy files
+# under COLUMNAR_CACHE_DIR (memory-mapped, so every worker process shares
+# the same pages), filters become boolean masks, and the (NULL, key, ID)
+# order of each sortable column is argsorted once when the arrays are
+# built. A page is then a slice of flatnonzero(mask[order]) and a cursor a
+# binary search in it; only the rows on the page are read from SQLite. The
+# arrays are rebuilt in the background whenever the database changes (by
+# one worker process at a time), with searches going through SQL meanwhile.
+# Off by default: the arrays take about 90 bytes per level on disk.
+
+ENABLE_COLUMNAR = False
+COLUMNAR_CACHE_DIR = "./columnar_cache"
+# Bump when the array layout changes
+COLUMNAR_FORMAT_VERSION = 1
+COLUMNAR_FIELDS = ("CreatorPoints", "Size", "ObjectCount", "EditorTime", "EditorCTime", "rCoins", "sCoins")
+COLUMNAR_SORTS = ("Size", "CreatorPoints")
+COLUMNAR_BATCH_ROWS = 20000
+# Seconds after which a build lock is taken to be left over from a crash
+COLUMNAR_LOCK_TIMEOUT = 3600
+
+# Query arg -> (field, comparison), matching build_where
+COLUMNAR_FILTERS = {
+    "min_cp": ("CreatorPoints", ">="),
+    "max_cp": ("CreatorPoints", "<="),
+    "min_size": ("Size", ">="),
+    "max_size": ("Size", "<="),
+    "min_object_count": ("ObjectCount", ">="),
+    "max_object_count": ("ObjectCount", "<="),
+    "min_editor_time": ("EditorTime", ">="),
+    "max_editor_time": ("EditorTime", "<="),
+    "editor_ctime": ("EditorCTime", "=="),
+    "rcoins": ("rCoins", "=="),
+    "scoins": ("sCoins", "=="),
+}
+_columnar_index = None
+_columnar_building = False
+_columnar_lock = threading.Lock()
+
+class ColumnarIndex:
+    """Memory-mapped arrays of one database version."""
+
+    def __init__(self, directory, version):
+        self.version = version
+        self.ids = np.load(os.path.join(directory, "ID.npy"), mmap_mode="r")
+        self.values = {}
+        self.valid = {}
+        for field in COLUMNAR_FIELDS:
+            self.values[field] = np.load(os.path.join(directory, f"{field}.npy"), mmap_mode="r")
+            self.valid[field] = np.load(os.path.join(directory, f"{field}.valid.npy"), mmap_mode="r")
+        # Row numbers in ascending (NULL first, key, ID) order; rows are stored by ID
+        self.orders = {
+            field: np.load(os.path.join(directory, f"order_{field}.npy"), mmap_mode="r")
+            for field in COLUMNAR_SORTS
+        }
+
+def _columnar_key(version):
+    return hashlib.sha1(repr((COLUMNAR_FORMAT_VERSION, db_files(), version)).encode("utf-8")).hexdigest()[:16]
+
+def _columnar_select(cur):
+    columns, _ = db_schema(cur)
+    exprs = []
+    for field in COLUMNAR_FIELDS:
+        expr = numeric_column(field, columns)
+        exprs += [f"COALESCE({expr}, 0)", f"{expr} IS NOT NULL"]
+    return f"SELECT ID, {', '.join(exprs)} FROM levels ORDER BY ID"
+
+def build_columnar_index(version):
+    """Write the arrays for the current database to COLUMNAR_CACHE_DIR and return their directory.
+
+    The arrays are filled in place as memory-mapped .npy files, so only one
+    batch of rows (plus a sort order while it is computed) is held in memory.
+    """
+    directory = os.path.join(COLUMNAR_CACHE_DIR, _columnar_key(version))
+    if os.path.isdir(directory):
+        return directory
+    temp_dir = f"{directory}.{os.getpid()}.{threading.get_ident()}.tmp"
+    os.makedirs(temp_dir, exist_ok=True)
+    conns = [open_readonly_db(db_file) for db_file in db_files()]
+    try:
+        # One read transaction per file, so the counts match the rows read
+        for conn in conns:
+            conn.execute("BEGIN")
+        count = sum(conn.execute("SELECT COUNT(*) FROM levels").fetchone()[0] for conn in conns)
+
+        def create(name, dtype):
+            return np.lib.format.open_memmap(os.path.join(temp_dir, name), mode="w+", dtype=dtype, shape=(count,))
+        ids = create("ID.npy", np.int64)
+        values = {field: create(f"{field}.npy", np.int64) for field in COLUMNAR_FIELDS}
+        valid = {field: create(f"{field}.valid.npy", np.bool_) for field in COLUMNAR_FIELDS}
+
+        filled = 0
+        for conn in conns:
+            cur = conn.execute(_columnar_select(conn.cursor()))
+            while rows := cur.fetchmany(COLUMNAR_BATCH_ROWS):
+                batch = np.array(rows, dtype=np.int64)
+                end = filled + len(batch)
+                ids[filled:end] = batch[:, 0]
+                for i, field in enumerate(COLUMNAR_FIELDS):
+                    values[field][filled:end] = batch[:, 1 + 2 * i]
+                    valid[field][filled:end] = batch[:, 2 + 2 * i]
+                filled = end
+    finally:
+        for conn in conns:
+            conn.close()
+
+    if count > 1 and not (ids[1:] > ids[:-1]).all():
+        # Files that don't follow each other in ID order: sort one array at a time
+        by_id = np.argsort(ids, kind="stable")
+        for column in (ids, *values.values(), *valid.values()):
+            column[:] = column[by_id]
+        del by_id
+    for field in COLUMNAR_SORTS:
+        # lexsort's last key is the primary one
+        np.save(os.path.join(temp_dir, f"order_{field}.npy"), np.lexsort((ids, values[field], valid[field])))
+    for column in (ids, *values.values(), *valid.values()):
+        column.flush()
+    del ids, values, valid
+
+    try:
+        os.rename(temp_dir, directory)
+    except OSError:
+        # Another worker got there first
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    for name in os.listdir(COLUMNAR_CACHE_DIR):
+        path = os.path.join(COLUMNAR_CACHE_DIR, name)
+        if path != directory and not name.endswith((".tmp", ".lock")):
+            shutil.rmtree(path, ignore_errors=True)
+    return directory
+
+def _build_columnar_in_background(version, lock_path):
+    global _columnar_index, _columnar_building
+    try:
+        directory = build_columnar_index(version)
+        with _columnar_lock:
+            _columnar_index = ColumnarIndex(directory, version)
+    except Exception as e:
+        print(f"Columnar index build failed: {e}")
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(lock_path)
+        with _columnar_lock:
+            _columnar_building = False
+
+def _claim_columnar_build(lock_path):
+    """Create the build lock file; False while another process holds it."""
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        pass
+    try:
+        if time.time() - os.path.getmtime(lock_path) < COLUMNAR_LOCK_TIMEOUT:
+            return False
+        # Left behind by a build that died
+        os.remove(lock_path)
+    except OSError:
+        return False
+    return _claim_columnar_build(lock_path)
+
+def get_columnar_index():
+    """The arrays for the current database version, or None while they are
+    being built (or can't be used)."""
+    global _columnar_index, _columnar_building
+    if not ENABLE_COLUMNAR or np is None:
+        return None
+    version = db_version()
+    index = _columnar_index
+    if index is not None and index.version == version:
+        return index
+    key = _columnar_key(version)
+    directory = os.path.join(COLUMNAR_CACHE_DIR, key)
+    with _columnar_lock:
+        if os.path.isdir(directory):
+            # Built by another worker (or an earlier run)
+            try:
+                _columnar_index = ColumnarIndex(directory, version)
+            except (OSError, ValueError) as e:
+                # Removed by a newer build in the meantime, or damaged
+                print(f"Columnar index not loaded: {e}")
+                return None
+            return _columnar_index
+        if _columnar_building:
+            return None
+        os.makedirs(COLUMNAR_CACHE_DIR, exist_ok=True)
+        # One build per database version across all worker processes
+        lock_path = os.path.join(COLUMNAR_CACHE_DIR, f"{key}.lock")
+        if not _claim_columnar_build(lock_path):
+            return None
+        _columnar_building = True
+        threading.Thread(
+            target=_build_columnar_in_background, args=(version, lock_path), name="columnar-build", daemon=True
+        ).start()
+    return None
+
+def _columnar_conditions(filters):
+    """[(field, comparison, value)] for the filters, or None if SQL has to run them."""
+    conditions = []
+    for arg, value in filters.items():
+        if arg in ("search_mode", "case_sensitive"):
+            continue
+        if arg == "level_id":
+            if value:
+                level_number = parse_int(value) if value.strip().isdigit() else None
+                if level_number is None:
+                    return None
+                conditions.append(("ID", "==", level_number))
+        elif arg in COLUMNAR_FILTERS:
+            value = parse_int(value)
+            if value is not None:
+                conditions.append(COLUMNAR_FILTERS[arg] + (value,))
+        elif value:
+            return None
+    return conditions
+
+def _hydrate_shard(db_file, ids, sort_by, sort_order):
+    cur = get_db(db_file).cursor()
+    try:
+        columns, _ = db_schema(cur)
+        _, sort_key, _ = resolve_sort(columns, sort_by, sort_order)
+        cur.execute(
+            SEARCH_SELECT.format(sort_key=sort_key) + " AND ID IN (SELECT value FROM json_each(?))",
+            (json.dumps(ids),)
+        )
+        return cur.fetchall()
+    finally:
+        cur.close()
+
+def columnar_search(filters, sort_by, sort_order, page, page_size, position):
+    """search_levels() for numeric-only filters: (rows, total count), or None to use SQL."""
+    conditions = _columnar_conditions(filters)
+    if conditions is None:
+        return None
+    index = get_columnar_index()
+    if index is None:
+        return None
+
+    with timed("columnar"):
+        ids = index.ids
+        mask = None
+        for field, comparison, value in conditions:
+            if field == "ID":
+                condition = ids == value
+            else:
+                values = index.values[field]
+                if comparison == ">=":
+                    condition = values >= value
+                elif comparison == "<=":
+                    condition = values <= value
+                else:
+                    condition = values == value
+                condition &= index.valid[field]
+            mask = condition if mask is None else (mask & condition)
+
+        # Sort positions (in ascending order) of the matching rows
+        order = index.orders.get(sort_by)
+        if mask is None:
+            matches = np.arange(len(ids))
+        else:
+            matches = np.flatnonzero(mask if order is None else mask[order])
+        total_count = len(matches)
+
+        if position:
+            before, key, boundary_id = position
+            row = np.searchsorted(ids, boundary_id)
+            if row >= len(ids) or ids[row] != boundary_id:
+                return None
+            if order is not None:
+                valid = index.valid[sort_by][row]
+                if key != (int(index.values[sort_by][row]) if valid else None):
+                    # The cursor row changed since the cursor was made
+                    return None
+                boundary = int(np.flatnonzero(order == row)[0])
+            else:
+                boundary = row
+            # Rows after the cursor come later in ascending order, or earlier in descending
+            later = (sort_order == "asc") != before
+            if later:
+                start = np.searchsorted(matches, boundary, side="right")
+                positions = matches[start:start + page_size]
+            else:
+                end = np.searchsorted(matches, boundary, side="left")
+                positions = matches[max(end - page_size, 0):end]
+            if sort_order != "asc":
+                positions = positions[::-1]
+        else:
+            offset = (page - 1) * page_size
+            ordered = matches if sort_order == "asc" else matches[::-1]
+            positions = ordered[offset:offset + page_size]
+
+        rows = positions if order is None else order[positions]
+        page_ids = [int(level_id) for level_id in ids[rows]]
+
+    by_id = {}
+    for shard_rows in on_shards(_hydrate_shard, page_ids, sort_by, sort_order):
+        for row in shard_rows:
+            by_id[row[0]] = row
+    return [by_id[level_id] for level_id in page_ids if level_id in by_id], total_count
+
+SEARCH_SELECT = """
+    SELECT
+      ID, Name, Username, CreatorPoints, Description, Size, songID,
+      OriginalID, rCoins, sCoins, Version, Length, EditorTime, EditorCTime,
+      RequestedRating, TwoPlayer, ObjectCount, {sort_key}
+    FROM levels
+    WHERE 1=1
+"""
+
+def _search_shard(db_file, filters, sort_by, sort_order, position, limit, offset, count):
+    """One database file's part of search_levels(): (rows in result order, match count or None)."""
+    cur = get_db(db_file).cursor()
+    try:
+        columns, _ = db_schema(cur)
+        where_sql, params = build_where(cur, **filters)
+        sort_by, sort_key, sort_order = resolve_sort(columns, sort_by, sort_order)
 
-    # Assemble final SQL
-    sql = select_sql + (" AND " + " AND ".join(where) if where else "")
+        # Assemble final SQL
+        sql = SEARCH_SELECT.format(sort_key=sort_key) + where_sql
 
-    # Sorting
-    if sort_by == "Size":
-        sql += f" ORDER BY CAST(REPLACE(Size,' B','') AS INTEGER) {sort_order.upper()}"
-    elif sort_by in ("ID", "CreatorPoints"):
-        sql += f" ORDER BY {sort_by} {sort_order.upper()}"
+        # Pagination: seek past the cursor row when we have one, otherwise
+        # (page jumps, first visit) fall back to OFFSET
+        if position:
+            before, key, boundary_id = position
+            direction = sort_order if not before else ("desc" if sort_order == "asc" else "asc")
+            results = []
+            with timed("db_query"):
+                for predicate, predicate_params in keyset_predicates(
+                    sort_key, key, boundary_id, greater=(sort_order == "asc") != before
+                ):
+                    cur.execute(
+                        sql + f" AND {predicate}" + order_by_sql(sort_key, direction) + " LIMIT ?",
+                        params + predicate_params + [limit - len(results)]
+                    )
+                    results += cur.fetchall()
+                    if len(results) >= limit:
+                        break
+            if before:
+                results.reverse()
+        else:
+            with timed("db_query"):
+                cur.execute(sql + order_by_sql(sort_key, sort_order) + " LIMIT ? OFFSET ?", params + [limit, offset])
+                results = cur.fetchall()
 
-    # Pagination
-    offset = (page - 1) * page_size
-    sql_with_pagination = sql + " LIMIT ? OFFSET ?"
-    params_with_pagination = params + [page_size, offset]
+        total_count = None
+        if count:
+            with timed("db_count"):
+                cur.execute("SELECT COUNT(*) FROM levels WHERE 1=1" + where_sql, params)
+                total_count = cur.fetchone()[0]
+        return results, total_count
+    finally:
+        cur.close()
 
-    cur.execute(sql_with_pagination, params_with_pagination)
-    results = cur.fetchall()
+def search_levels(level_id, name, username, description, song_id, min_cp, max_cp,
+                  min_size, max_size, search_mode, case_sensitive,
+                  sort_by, sort_order, page, page_size,
+                  original_id, rcoins, scoins, version, length,
+                  min_editor_time, max_editor_time, editor_ctime,
+                  requested_rating, two_player, min_object_count, max_object_count,
+                  cursor=None, raw=False):
+    filters = dict(
+        level_id=level_id, name=name, username=username, description=description,
+        song_id=song_id, min_cp=min_cp, max_cp=max_cp, min_size=min_size, max_size=max_size,
+        search_mode=search_mode, case_sensitive=case_sensitive,
+        original_id=original_id, rcoins=rcoins, scoins=scoins, version=version, length=length,
+        min_editor_time=min_editor_time, max_editor_time=max_editor_time, editor_ctime=editor_ctime,
+        requested_rating=requested_rating, two_player=two_player,
+        min_object_count=min_object_count, max_object_count=max_object_count
+    )
+    files = db_files()
+    cur = get_db(files[0]).cursor()
+    try:
+        columns, _ = db_schema(cur)
+        where_sql, params = build_where(cur, **filters)
+        sort_by, _, sort_order = resolve_sort(columns, sort_by, sort_order)
+    finally:
+        cur.close()
+
+    # Total count (the same for every page of a search, so cached until
+    # the database changes)
+    count_key = (where_sql, tuple(params))
+    version = db_version()
+    total_count = count_cache.get(count_key, version)
 
-    # Total count
-    count_sql = "SELECT COUNT(*) FROM levels WHERE 1=1" + (" AND " + " AND ".join(where) if where else "")
-    cur.execute(count_sql, params)
-    total_count = cur.fetchone()[0]
+    position = decode_cursor(cursor, sort_by, sort_order)
+    offset = 0 if position else (page - 1) * page_size
+    columnar = columnar_search(filters, sort_by, sort_order, page, page_size, position)
+    if columnar is not None:
+        results, counts = columnar[0], [columnar[1]]
+        total_count = None
+    elif len(files) == 1:
+        results, count = on_shards(
+            _search_shard, filters, sort_by, sort_order, position, page_size, offset, total_count is None
+        )[0]
+        counts = [count]
+    else:
+        # Any row of the merged page is within the first offset + page_size
+        # rows of its own shard
+        parts = on_shards(
+            _search_shard, filters, sort_by, sort_order, position,
+            offset + page_size, 0, total_count is None
+        )
+        merged = list(merge_sorted([rows for rows, _ in parts], 17, sort_order))
+        if position and position[0]:
+            # Going backwards: the rows closest before the cursor
+            results = merged[-page_size:]
+        else:
+            results = merged[offset:offset + page_size]
+        counts = [count for _, count in parts]
 
-    conn.close()
+    if total_count is None:
+        total_count = sum(counts)
+        count_cache.put(count_key, total_count, version,
+                        size=len(where_sql) + sum(len(str(p)) for p in params))
+
+    next_cursor = prev_cursor = None
+    if results:
+        if len(results) == page_size:
+            next_cursor = encode_cursor(sort_by, sort_order, False, results[-1][17], results[-1][0])
+        if page > 1:
+            prev_cursor = encode_cursor(sort_by, sort_order, True, results[0][17], results[0][0])
+
+    if raw:
+        return [row[:17] for row in results], total_count, next_cursor, prev_cursor
 
     results = [(
         row[0], row[1], row[2], row[3], row[4],
@@ -444,78 +2168,349 @@ def search_levels(level_id, name, username, description, song_id, min_cp, max_cp
         row[16], # ObjectCount
     ) for row in results]
 
-    return results, total_count
+    return results, total_count, next_cursor, prev_cursor
+
+def _song_level_counts_shard(db_file, ids):
+    cur = get_db(db_file).cursor()
+    try:
+        _, tables = db_schema(cur)
+        if "level_songs" not in tables:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        cur.execute(
+            f"SELECT song_id, COUNT(*) FROM level_songs WHERE song_id IN ({placeholders}) GROUP BY song_id",
+            ids
+        )
+        return cur.fetchall()
+    finally:
+        cur.close()
+
+def song_level_counts(song_ids):
+    """Map each song ID (as a string) to the number of levels using it."""
+    ids = sorted({int(sid) for sid in song_ids if sid.isdecimal()})
+    if not ids:
+        return {}
+    counts = {}
+    for rows in on_shards(_song_level_counts_shard, ids):
+        for sid, count in rows:
+            counts[str(sid)] = counts.get(str(sid), 0) + count
+    return counts
+
+def _facet_sort_key(field, value):
+    if field == "Length" and value in LENGTH_ORDER:
+        return (0, LENGTH_ORDER.index(value), "")
+    if isinstance(value, int) or str(value).isdecimal():
+        return (0, int(value), "")
+    return (1, 0, str(value))
+
+def _facet_counts_shard(db_file, filters, scan):
+    """{field: {value: count}} for one database file, or None if it would need a scan and scan is False."""
+    cur = get_db(db_file).cursor()
+    try:
+        _, tables = db_schema(cur)
+        where_sql, params = build_where(cur, **filters)
+        totals = {field: {} for field in FACET_FIELDS}
+        with timed("db_facets"):
+            if not where_sql and "level_facets" in tables:
+                cur.execute("SELECT field, value, count FROM level_facets WHERE count > 0")
+                for field, value, count in cur:
+                    if field in totals:
+                        totals[field][value] = count
+            elif scan:
+                # One pass over the matches, grouped on every facet at once
+                exprs = [expr.format("levels") for _, expr in FACET_FIELDS.values()]
+                cur.execute(
+                    f"SELECT {', '.join(exprs)}, COUNT(*) FROM levels WHERE 1=1{where_sql} "
+                    f"GROUP BY {', '.join(str(i) for i in range(1, len(exprs) + 1))}",
+                    params
+                )
+                for row in cur:
+                    for field, value in zip(FACET_FIELDS, row):
+                        totals[field][value] = totals[field].get(value, 0) + row[-1]
+            else:
+                return None
+        return totals
+    finally:
+        cur.close()
+
+def facet_counts(filters, total_count):
+    """Return [(field, query arg, [(value, count), ...])] for the search's matches,
+    or None when the search matches too many levels to count them."""
+    cur = get_db(db_files()[0]).cursor()
+    try:
+        where_sql, params = build_where(cur, **filters)
+    finally:
+        cur.close()
+    key = ("facets", where_sql, tuple(params))
+    version = db_version()
+    counts = count_cache.get(key, version)
+    if counts is not None:
+        return counts
+
+    totals = {field: {} for field in FACET_FIELDS}
+    for part in on_shards(_facet_counts_shard, filters, total_count <= FACET_SCAN_MAX_ROWS):
+        if part is None:
+            return None
+        for field, values in part.items():
+            for value, count in values.items():
+                totals[field][value] = totals[field].get(value, 0) + count
+
+    counts = [
+        (field, FACET_FIELDS[field][0],
+         sorted(((value, count) for value, count in values.items() if value != ""),
+                key=lambda item, field=field: _facet_sort_key(field, item[0])))
+        for field, values in totals.items()
+    ]
+    count_cache.put(key, counts, version, size=len(where_sql) + 64 * sum(len(v) for _, _, v in counts))
+    return counts
+
+# Query args accepted by build_where, in its parameter order
+SEARCH_FILTERS = (
+    "level_id", "name", "username", "description", "song_id",
+    "min_cp", "max_cp", "min_size", "max_size", "search_mode", "case_sensitive",
+    "original_id", "rcoins", "scoins", "version", "length",
+    "min_editor_time", "max_editor_time", "editor_ctime",
+    "requested_rating", "two_player", "min_object_count", "max_object_count",
+)
+
+def search_filters(args):
+    """Read the search form's filter fields from query args."""
+    filters = {field: args.get(field, "") for field in SEARCH_FILTERS}
+    filters["search_mode"] = args.get("search_mode", "contains")
+    filters["case_sensitive"] = args.get("case_sensitive", "insensitive")
+    return filters
+
+def _search_level_ids_shard(db_file, filters, sort_by, sort_order, limit):
+    cur = get_db(db_file).cursor()
+    try:
+        columns, _ = db_schema(cur)
+        where_sql, params = build_where(cur, **filters)
+        sort_by, sort_key, sort_order = resolve_sort(columns, sort_by, sort_order)
+        cur.execute(
+            f"SELECT ID, {sort_key} FROM levels WHERE 1=1" + where_sql
+            + order_by_sql(sort_key, sort_order) + " LIMIT ?",
+            params + [limit]
+        )
+        return cur.fetchall()
+    finally:
+        cur.close()
+
+def search_level_ids(filters, sort_by, sort_order, limit):
+    """IDs of the levels matching the filters, in result order, at most limit of them."""
+    parts = on_shards(_search_level_ids_shard, filters, sort_by, sort_order, limit)
+    rows = parts[0] if len(parts) == 1 else merge_sorted(parts, 1, sort_order)
+    return [row[0] for row in itertools.islice(rows, limit)]
+
+# The index template is compiled once instead of on every render_template_string call
+INDEX_TEMPLATE = app.jinja_env.from_string(HTML)
+
+# --- Page Cache ---
+# Rendered result pages are cached per normalized query string until
+# levels.db changes. The ETag is derived from the same inputs (plus the
+# template), so a revalidating browser gets a 304 without any SQL or
+# rendering at all. Set PAGE_CACHE_MAX_BYTES to 0 to keep only the ETags.
+
+PAGE_CACHE_MAX_BYTES = 32 * 1024**2
+
+page_cache = LRUCache(PAGE_CACHE_MAX_BYTES)
+_TEMPLATE_HASH = hashlib.sha1(HTML.encode("utf-8")).hexdigest()
+
+def normalized_query(args):
+    return urllib.parse.urlencode(sorted(args.items(multi=True)))
+
+def page_etag(query, version):
+    return hashlib.sha1(repr((_TEMPLATE_HASH, version, query)).encode("utf-8")).hexdigest()
 
 @app.route("/")
 def index():
-    level_id = request.args.get("level_id", "")
-    name = request.args.get("name", "")
-    username = request.args.get("username", "")
-    description = request.args.get("description", "")
-    song_id = request.args.get("song_id", "")
+    query = normalized_query(request.args)
+    version = db_version()
+    etag = page_etag(query, version)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = page_cache.get(query, version)
+        if body is None:
+            body = render_index().encode("utf-8")
+            page_cache.put(query, body, version, size=len(body) + len(query))
+        response = Response(body, mimetype="text/html")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    if PREFETCH_ENABLED:
+        plan = prefetch_plan(query, version)
+        if plan:
+            response.call_on_close(lambda: schedule_prefetch(*plan))
+    return response
 
-    # New fields
-    original_id = request.args.get("original_id", "")
-    rcoins = request.args.get("rcoins", "")
-    scoins = request.args.get("scoins", "")
-    version = request.args.get("version", "")
-    length = request.args.get("length", "")
-    min_editor_time = request.args.get("min_editor_time", "")
-    max_editor_time = request.args.get("max_editor_time", "")
-    editor_ctime = request.args.get("editor_ctime", "")
-    requested_rating = request.args.get("requested_rating", "")
-    two_player = request.args.get("two_player", "")
-    min_object_count = request.args.get("min_object_count", "")
-    max_object_count = request.args.get("max_object_count", "")
-
-    min_cp = request.args.get("min_cp")
-    max_cp = request.args.get("max_cp")
-    min_size = request.args.get("min_size")
-    max_size = request.args.get("max_size")
-    search_mode = request.args.get("search_mode", "contains")
-    case_sensitive = request.args.get("case_sensitive", "insensitive")
+def render_index():
+    filters = search_filters(request.args)
     sort_by = request.args.get("sort_by", "ID")
     sort_order = request.args.get("sort_order", "desc")
     page_size = int(request.args.get("page_size", 10))
     page = int(request.args.get("page", 1))
+    cursor = request.args.get("cursor")
 
-    results, total_count = search_levels(
-        level_id, name, username, description, song_id,
-        min_cp, max_cp, min_size, max_size,
-        search_mode, case_sensitive, sort_by,
-        sort_order, page, page_size,
-        original_id, rcoins, scoins, version, length,
-        min_editor_time, max_editor_time, editor_ctime,
-        requested_rating, two_player, min_object_count, max_object_count
+    results, total_count, next_cursor, prev_cursor = search_levels(
+        sort_by=sort_by, sort_order=sort_order, page=page, page_size=page_size,
+        cursor=cursor, **filters
     )
 
     total_pages = max(1, math.ceil(total_count / page_size))
+    song_counts = song_level_counts(
+        sid.strip() for row in results if row[6] for sid in row[6].split(",")
+    )
+    # Query args that every pagination link and form carries along
+    hidden_args = [(k, v) for k, v in request.args.items() if k not in ("page", "cursor")]
 
-    return render_template_string(
-        HTML,
-        level_id=level_id, name=name, username=username,
-        description=description, song_id=song_id,
-        min_cp=min_cp, max_cp=max_cp,
-        min_size=min_size, max_size=max_size,
-        search_mode=search_mode, case_sensitive=case_sensitive,
-        sort_by=sort_by, sort_order=sort_order,
-        results=results, searched=True,
-        page=page, page_size=page_size, total_pages=total_pages,
-        request=request,
-        original_id=original_id, rcoins=rcoins, scoins=scoins,
-        version=version, length=length,
-        min_editor_time=min_editor_time, max_editor_time=max_editor_time,
-        editor_ctime=editor_ctime, requested_rating=requested_rating,
-        two_player=two_player, min_object_count=min_object_count,
-        max_object_count=max_object_count
+    # Each facet value links to this search narrowed to that value
+    facets = []
+    for field, arg, values in (facet_counts(filters, total_count) or []) if results else []:
+        other_args = [(k, v) for k, v in hidden_args if k != arg]
+        links = [(value, count, urllib.parse.urlencode(other_args + [(arg, value)])) for value, count in values]
+        if links:
+            facets.append((field, links))
+
+    if PREFETCH_ENABLED:
+        next_query = None
+        if page < total_pages:
+            next_args = hidden_args + [("page", page + 1)] + ([("cursor", next_cursor)] if next_cursor else [])
+            next_query = urllib.parse.urlencode(next_args)
+        song_ids = sorted({
+            int(sid) for row in results if row[6] for sid in row[6].split(",") if sid.strip().isdecimal()
+        })
+        g.prefetch_plan = ([row[0] for row in results], song_ids, next_query)
+
+    with timed("render"):
+        return render_template(
+            INDEX_TEMPLATE,
+            sort_by=sort_by, sort_order=sort_order,
+            results=results, searched=True, song_counts=song_counts, facets=facets,
+            page=page, page_size=page_size, total_pages=total_pages,
+            next_cursor=next_cursor, prev_cursor=prev_cursor,
+            hidden_args=hidden_args, base_query=urllib.parse.urlencode(hidden_args),
+            **filters
+        )
+
+# --- JSON API ---
+# /api/search takes the same query args as the index page. By default it
+# returns one page as JSON; format=ndjson or format=csv instead streams every
+# match straight off an SQLite cursor, so memory use doesn't depend on the
+# size of the result.
+
+API_MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_BYTES = 64 * 1024
+
+# Columns of a search result row, in order
+RESULT_COLUMNS = (
+    "ID", "Name", "Username", "CreatorPoints", "Description", "Size", "songID",
+    "OriginalID", "rCoins", "sCoins", "Version", "Length", "EditorTime", "EditorCTime",
+    "RequestedRating", "TwoPlayer", "ObjectCount",
+)
+
+def _search_rows_cursor(conn, filters, sort_by, sort_order):
+    cur = conn.cursor()
+    columns, _ = db_schema(cur)
+    where_sql, params = build_where(cur, **filters)
+    sort_by, sort_key, sort_order = resolve_sort(columns, sort_by, sort_order)
+    cur.execute(
+        f"SELECT {', '.join(RESULT_COLUMNS)}, {sort_key} FROM levels WHERE 1=1"
+        + where_sql + order_by_sql(sort_key, sort_order),
+        params
     )
+    return cur
 
-@app.route("/download/<int:level_id>")
-def download(level_id):
-    file_path = find_level_file(str(level_id))
-    if not file_path:
-        abort(404, description="Level file not found")
+def iter_search_rows(filters, sort_by, sort_order):
+    """Yield every row matching the filters, in result order."""
+    # Connections of its own: the export outlives any single query on the
+    # thread's shared connections
+    conns = [open_readonly_db(db_file) for db_file in db_files()]
+    try:
+        cursors = [_search_rows_cursor(conn, filters, sort_by, sort_order) for conn in conns]
+        rows = cursors[0] if len(cursors) == 1 else merge_sorted(cursors, len(RESULT_COLUMNS), sort_order)
+        for row in rows:
+            yield row[:-1]
+    finally:
+        for conn in conns:
+            conn.close()
+
+def _batched(lines):
+    """Join small strings into chunks of about EXPORT_BATCH_BYTES."""
+    batch = []
+    size = 0
+    for line in lines:
+        batch.append(line)
+        size += len(line)
+        if size >= EXPORT_BATCH_BYTES:
+            yield "".join(batch)
+            batch = []
+            size = 0
+    if batch:
+        yield "".join(batch)
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(RESULT_COLUMNS, row)), ensure_ascii=False) + "\n"
+
+def iter_csv(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(RESULT_COLUMNS)
+    for row in rows:
+        writer.writerow(row)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+@app.route("/api/search")
+def api_search():
+    filters = search_filters(request.args)
+    sort_by = request.args.get("sort_by", "ID")
+    sort_order = request.args.get("sort_order", "desc")
+    export_format = request.args.get("format", "json")
 
+    if export_format in ("ndjson", "csv"):
+        rows = iter_search_rows(filters, sort_by, sort_order)
+        if export_format == "ndjson":
+            return Response(_batched(iter_ndjson(rows)), mimetype="application/x-ndjson")
+        return Response(
+            _batched(iter_csv(rows)),
+            mimetype="text/csv",
+            headers={"Content-Disposition": attachment_header("levels.csv")}
+        )
+    if export_format != "json":
+        return jsonify(error="format must be json, ndjson or csv"), 400
+
+    try:
+        page_size = min(int(request.args.get("page_size", 10)), API_MAX_PAGE_SIZE)
+        page = int(request.args.get("page", 1))
+    except ValueError:
+        return jsonify(error="page and page_size must be integers"), 400
+    if page < 1 or page_size < 1:
+        return jsonify(error="page and page_size must be positive"), 400
+
+    results, total_count, next_cursor, prev_cursor = search_levels(
+        sort_by=sort_by, sort_order=sort_order, page=page, page_size=page_size,
+        cursor=request.args.get("cursor"), raw=True, **filters
+    )
+    return jsonify(
+        results=[dict(zip(RESULT_COLUMNS, row)) for row in results],
+        total=total_count,
+        page=page,
+        page_size=page_size,
+        total_pages=max(1, math.ceil(total_count / page_size)),
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor
+    )
+
+def attachment_header(filename):
+    """Content-Disposition value for a download, RFC 5987-encoded if not ASCII."""
+    try:
+        filename.encode("ascii")
+    except UnicodeEncodeError:
+        return f"attachment; filename*=UTF-8''{urllib.parse.quote(filename, safe='')}"
+    return f'attachment; filename="{filename}"'
+
+def gmd_download_name(level_id, file_path):
     filename = os.path.splitext(os.path.basename(file_path))[0]  # remove extension
     if " - " in filename:
         _, level_name = filename.split(" - ", 1)
@@ -523,66 +2518,479 @@ def download(level_id):
         level_name = filename
 
     safe_level_name = "".join(c for c in level_name if c.isalnum() or c in " _-").rstrip()
+    return f"{level_id} - {safe_level_name}.gmd"
 
-    with open(file_path, "r", encoding="utf-8") as f:
-        data = f.read()
-    pairs = parse_level_data(data)
-    xml_content = make_gmd(level_id, pairs)
+@app.route("/download/<int:level_id>")
+def download(level_id):
+    file_path = find_level_file(str(level_id))
+    if not file_path:
+        abort(404, description="Level file not found")
+
+    download_name = gmd_download_name(level_id, file_path)
+    if not gmd_cache.max_bytes:
+        # Cache disabled: stream the conversion straight to the client
+        return Response(
+            iter_gmd(level_id, file_path),
+            mimetype="application/octet-stream",
+            headers={"Content-Disposition": attachment_header(download_name)}
+        )
+
+    gmd_path, source_stat = get_cached_gmd(level_id, file_path)
 
-    buf = BytesIO(xml_content.encode("utf-8"))
-    buf.seek(0)
+    # send_file answers If-None-Match / If-Modified-Since with 304
     return send_file(
-        buf,
+        gmd_path,
         as_attachment=True,
-        download_name=f"{level_id} - {safe_level_name}.gmd",
-        mimetype="application/octet-stream"
+        download_name=download_name,
+        mimetype="application/octet-stream",
+        etag=gmd_cache_key(level_id, source_stat),
+        last_modified=source_stat.st_mtime,
+        conditional=True
     )
 
+# --- Bulk Download ---
+# /downloadZip streams a ZIP of many converted levels. Lookups and
+# conversions run ahead in a small thread pool while the response writes
+# finished entries, and zipfile writes to a non-seekable sink (using data
+# descriptors), so neither the archive nor the list of files is buffered.
+
+ZIP_MAX_LEVELS = 5000
+ZIP_WORKERS = 4
+ZIP_CHUNK_SIZE = 256 * 1024
+
+_zip_executor = None
+_zip_executor_lock = threading.Lock()
+
+def _get_zip_executor():
+    global _zip_executor
+    with _zip_executor_lock:
+        if _zip_executor is None:
+            _zip_executor = ThreadPoolExecutor(max_workers=ZIP_WORKERS, thread_name_prefix="zip")
+        return _zip_executor
+
+class _ZipSink:
+    """Write-only file object that collects what zipfile writes so it can be yielded."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def _prepare_zip_entry(level_id):
+    """Find and (if caching) convert one level. Runs in the zip thread pool."""
+    file_path = find_level_file(str(level_id))
+    if not file_path:
+        return level_id, None, None, None
+    if gmd_cache.max_bytes:
+        gmd_path, source_stat = get_cached_gmd(level_id, file_path)
+    else:
+        gmd_path, source_stat = None, os.stat(file_path)
+    return level_id, file_path, gmd_path, source_stat
+
+def _iter_zip_entry_data(level_id, file_path, gmd_path):
+    if gmd_path:
+        try:
+            with open(gmd_path, "rb") as f:
+                while chunk := f.read(ZIP_CHUNK_SIZE):
+                    yield chunk
+            return
+        except FileNotFoundError:
+            pass  # evicted in the meantime, convert again below
+    yield from iter_gmd(level_id, file_path)
+
+def iter_gmd_zip(level_ids):
+    """Yield a ZIP archive of the .gmd files for level_ids as it is built."""
+    sink = _ZipSink()
+    executor = _get_zip_executor()
+    pending = deque()
+    ids = iter(level_ids)
+    missing = []
+    try:
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            while True:
+                # Keep a bounded window of lookups/conversions in flight
+                while len(pending) < ZIP_WORKERS * 2:
+                    level_id = next(ids, None)
+                    if level_id is None:
+                        break
+                    pending.append(executor.submit(_prepare_zip_entry, level_id))
+                if not pending:
+                    break
+                level_id, file_path, gmd_path, source_stat = pending.popleft().result()
+                if file_path is None:
+                    missing.append(str(level_id))
+                    continue
+                info = zipfile.ZipInfo(
+                    gmd_download_name(level_id, file_path),
+                    date_time=time.localtime(source_stat.st_mtime)[:6]
+                )
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with zf.open(info, "w") as dest:
+                    for chunk in _iter_zip_entry_data(level_id, file_path, gmd_path):
+                        dest.write(chunk)
+                        data = sink.take()
+                        if data:
+                            yield data
+            if missing:
+                zf.writestr("missing.txt", "Level files not found:\n" + "\n".join(missing) + "\n")
+        yield sink.take()
+    finally:
+        for future in pending:
+            future.cancel()
+
+@app.route("/downloadZip")
+def download_zip():
+    """ZIP of the levels given by ?ids=1,2,3, or of every result of a search
+    (same query args as the index page, capped at ZIP_MAX_LEVELS)."""
+    ids_arg = request.args.get("ids", "")
+    if ids_arg:
+        level_ids = []
+        level_ids_seen = set()
+        for part in ids_arg.split(","):
+            level_id = parse_int(part) if part.strip().isdecimal() else None
+            if level_id is not None and level_id not in level_ids_seen:
+                level_ids_seen.add(level_id)
+                level_ids.append(level_id)
+        level_ids = level_ids[:ZIP_MAX_LEVELS]
+    else:
+        level_ids = search_level_ids(
+            search_filters(request.args),
+            request.args.get("sort_by", "ID"),
+            request.args.get("sort_order", "desc"),
+            ZIP_MAX_LEVELS
+        )
+    if not level_ids:
+        abort(404, description="No levels to download")
+
+    return Response(
+        iter_gmd_zip(level_ids),
+        mimetype="application/zip",
+        headers={"Content-Disposition": attachment_header("levels.zip")}
+    )
+
+# --- Song Info ---
+# Boomlings song lookups (URL and name) are cached in a small SQLite store
+# with a TTL, including "not available" answers for deleted songs. Threads
+# asking for the same uncached song at once share a single upstream call.
+
+SONG_INFO_TTL = 7 * 24 * 3600
+SONG_INFO_NEGATIVE_TTL = 6 * 3600
+
+_song_info_local = threading.local()
+_song_info_inflight = {}
+_song_info_inflight_lock = threading.Lock()
+
+def _song_info_conn():
+    conn = getattr(_song_info_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(SONG_INFO_DB, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS song_info (
+              song_id INTEGER PRIMARY KEY,
+              url TEXT,
+              name TEXT,
+              expires REAL NOT NULL
+            )
+        """)
+        conn.commit()
+        _song_info_local.conn = conn
+    return conn
+
+def parse_song_info(text, song_id):
+    """Parse a getGJSongInfo response into (url, name), or None if the song doesn't exist."""
+    if text.strip().startswith("-"):
+        # -1 / -2: deleted or not allowed
+        return None
+    parts = text.split("~|~")
+    parsed = {parts[i]: parts[i + 1] for i in range(0, len(parts) - 1, 2)}
+    if not parsed.get("10"):
+        return None
+    return urllib.parse.unquote(parsed["10"]), parsed.get("2", f"song_{song_id}")
+
+def song_info_request(song_id):
+    """Form data and headers for a getGJSongInfo call."""
+    data = {
+        "secret": "Wmfd2893gb7",
+        "binaryVersion": 45,
+        "songID": song_id
+    }
+    headers = {"User-Agent": ""}
+    return data, headers
+
+def fetch_song_info(song_id):
+    """Ask Boomlings for a song; return (url, name), or None if it doesn't exist."""
+    data, headers = song_info_request(song_id)
+    upstream_in_flight.inc("song_info")
+    try:
+        with timed("upstream_song_info"):
+            response = http_session.post(BOOMLINGS_SONG_INFO_URL, data=data, headers=headers, timeout=HTTP_TIMEOUT)
+    finally:
+        upstream_in_flight.dec("song_info")
+    upstream_bytes.inc("song_info", len(response.content))
+    response.raise_for_status()
+    return parse_song_info(response.text, song_id)
+
+def cached_song_info(song_id):
+    """Return (True, info) for an unexpired cache entry, else (False, None)."""
+    row = _song_info_conn().execute(
+        "SELECT url, name, expires FROM song_info WHERE song_id = ?", (song_id,)
+    ).fetchone()
+    if row is None or row[2] <= time.time():
+        return False, None
+    return True, ((row[0], row[1]) if row[0] else None)
+
+def store_song_info(song_id, info):
+    ttl = SONG_INFO_TTL if info else SONG_INFO_NEGATIVE_TTL
+    url, name = info if info else (None, None)
+    conn = _song_info_conn()
+    conn.execute(
+        "INSERT OR REPLACE INTO song_info (song_id, url, name, expires) VALUES (?, ?, ?, ?)",
+        (song_id, url, name, time.time() + ttl)
+    )
+    conn.commit()
+
+def get_song_info(song_id):
+    """Cached fetch_song_info()."""
+    found, info = cached_song_info(song_id)
+    if found:
+        return info
+
+    with _song_info_inflight_lock:
+        future = _song_info_inflight.get(song_id)
+        leader = future is None
+        if leader:
+            future = Future()
+            _song_info_inflight[song_id] = future
+    if not leader:
+        return future.result()
+
+    try:
+        info = fetch_song_info(song_id)
+        store_song_info(song_id, info)
+        future.set_result(info)
+        return info
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _song_info_inflight_lock:
+            _song_info_inflight.pop(song_id, None)
+
+# --- Song Cache ---
+# Songs fetched from the CDN are kept on disk (LRU, bounded by
+# SONG_CACHE_MAX_BYTES). A miss is streamed to the client while it is being
+# written to the cache; a hit is sent from disk with Range support.
+
+SONG_CACHE_DIR = "./song_cache"
+SONG_CACHE_MAX_BYTES = 5 * 1024**3
+SONG_CHUNK_SIZE = 64 * 1024
+
+song_cache = DiskCache(SONG_CACHE_DIR, SONG_CACHE_MAX_BYTES, ".song")
+
+SONG_UNAVAILABLE_MESSAGE = "Song is not available, this can happen if it's a main level song, or if it was deleted."
+
+def stream_song(upstream, cache_key):
+    """Yield an upstream response's body, caching it once fully received."""
+    temp_path = song_cache.temp_path(cache_key) if song_cache.max_bytes else None
+    complete = False
+    chunks = upstream.iter_content(SONG_CHUNK_SIZE)
+    if METRICS_ENABLED:
+        chunks = count_bytes(upstream_bytes, "song", chunks)
+    try:
+        if temp_path is None:
+            yield from chunks
+            return
+        with open(temp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        complete = True
+    finally:
+        upstream.close()
+        upstream_in_flight.dec("song")
+        if temp_path is not None:
+            if complete:
+                song_cache.commit(temp_path, cache_key)
+            else:
+                song_cache.discard(temp_path)
+
 @app.route("/downloadSong/<int:songID>")
 def getSongURL(songID):
     try:
         if songID >= 10000000:
             # Direct CDN OGG file
-            songURL = f"https://geometrydashfiles.b-cdn.net/music/{songID}.ogg"
-            songName = MUSIC_LIBRARY.get(songID, f"song_{songID}")
+            songURL = SONG_CDN_URL.format(song_id=songID)
+            songName = get_music_library().get(songID, f"song_{songID}")
             mimetype = "audio/ogg"
             ext = "ogg"
         else:
             # Use Boomlings API
-            url = "http://www.boomlings.com/database/getGJSongInfo.php"
-            data = {
-                "secret": "Wmfd2893gb7",
-                "binaryVersion": 45,
-                "songID": songID
-            }
-            headers = {"User-Agent": ""}
-            response = requests.post(url, data=data, headers=headers)
-            response.raise_for_status()
-
-            level = response.text
-            parts = level.split("~|~")
-            parsed = {parts[i]: parts[i + 1] for i in range(0, len(parts) - 1, 2)}
-
-            songURL = urllib.parse.unquote(parsed.get("10"))
-            songName = parsed.get("2", f"song_{songID}")
+            info = get_song_info(songID)
+            if info is None:
+                raise LookupError(f"song {songID} is not available")
+            songURL, songName = info
             mimetype = "audio/mpeg"
             ext = "mp3"
 
-        # Download file into memory
-        r = requests.get(songURL, stream=True)
-        r.raise_for_status()
-        file_data = BytesIO(r.content)
-
-        # Send back to client
-        return send_file(
-            file_data,
-            as_attachment=True,
-            download_name=f"{songName}.{ext}",
-            mimetype=mimetype
-        )
+        download_name = f"{songName}.{ext}"
+        cache_key = f"{songID}.{ext}"
+        cached_path = song_cache.lookup(cache_key) if song_cache.max_bytes else None
+        if cached_path:
+            # Handles Range (206) and conditional requests
+            return send_file(
+                cached_path,
+                as_attachment=True,
+                download_name=download_name,
+                mimetype=mimetype,
+                conditional=True
+            )
+
+        # Relay the file as it arrives, saving a copy for next time
+        upstream_in_flight.inc("song")
+        try:
+            with timed("upstream_song"):
+                r = http_session.get(songURL, stream=True, timeout=HTTP_TIMEOUT)
+            r.raise_for_status()
+        except BaseException:
+            upstream_in_flight.dec("song")
+            raise
+        headers = {"Content-Disposition": attachment_header(download_name)}
+        if "Content-Length" in r.headers and "Content-Encoding" not in r.headers:
+            headers["Content-Length"] = r.headers["Content-Length"]
+        return Response(stream_song(r, cache_key), mimetype=mimetype, headers=headers)
 
     except Exception as e:
-        return Response(f"Song is not available, this can happen if it's a main level song, or if it was deleted.", status=500)
-    
+        return Response(SONG_UNAVAILABLE_MESSAGE, status=500)
+
+# --- Prefetch ---
+# After a results page is sent, the levels and songs on it are warmed in the
+# background: level files are located and converted into the GMD cache,
+# Boomlings song info is looked up, and the next page is rendered into the
+# page cache. The queue is bounded and tasks that waited too long are
+# skipped, so under load prefetching is dropped instead of competing with
+# real requests. Off by default since it converts levels and calls Boomlings
+# for pages nobody may follow up on.
+
+PREFETCH_ENABLED = False
+PREFETCH_WORKERS = 2
+PREFETCH_QUEUE_SIZE = 256
+# Seconds a task may wait in the queue before it is no longer worth doing
+PREFETCH_MAX_AGE = 10.0
+PREFETCH_PLAN_MAX_BYTES = 4 * 1024**2
+
+prefetch_tasks = Counter("browse_prefetch_tasks_total", "Prefetch tasks by outcome.", "result")
+METRICS += (prefetch_tasks,)
+
+# Normalized query of a results page -> what to prefetch after showing it
+prefetch_plans = LRUCache(PREFETCH_PLAN_MAX_BYTES)
+
+_prefetch_queue = queue.Queue(PREFETCH_QUEUE_SIZE)
+_prefetch_pending = set()
+_prefetch_lock = threading.Lock()
+_prefetch_threads = []
+
+def prefetch_plan(query, version):
+    """(level IDs, song IDs, next page query) for a results page, remembered
+    from when it was rendered so cached pages are warmed too."""
+    plan = g.pop("prefetch_plan", None)
+    if plan is None:
+        return prefetch_plans.get(query, version)
+    prefetch_plans.put(query, plan, version, size=len(repr(plan)))
+    return plan
+
+def _prefetch_level(level_id):
+    file_path = find_level_file(str(level_id))
+    if file_path and gmd_cache.max_bytes:
+        get_cached_gmd(level_id, file_path)
+
+def _prefetch_song(song_id):
+    # CDN songs need nothing beyond the music library
+    if song_id < 10000000:
+        get_song_info(song_id)
+
+def _prefetch_page(query):
+    with app.test_request_context("/?" + query):
+        query = normalized_query(request.args)
+        version = db_version()
+        if page_cache.get(query, version) is None:
+            body = render_index().encode("utf-8")
+            page_cache.put(query, body, version, size=len(body) + len(query))
+        prefetch_plan(query, version)
+
+PREFETCH_TASKS = {"level": _prefetch_level, "song": _prefetch_song, "page": _prefetch_page}
+
+def _prefetch_loop():
+    while True:
+        queued_at, task = _prefetch_queue.get()
+        with _prefetch_lock:
+            _prefetch_pending.discard(task)
+        if time.monotonic() - queued_at > PREFETCH_MAX_AGE:
+            prefetch_tasks.inc("expired")
+            continue
+        kind, arg = task
+        try:
+            with timed(f"prefetch_{kind}"):
+                PREFETCH_TASKS[kind](arg)
+            prefetch_tasks.inc("done")
+        except Exception:
+            # The real request will run into (and report) the same problem
+            prefetch_tasks.inc("failed")
+
+def _start_prefetch_workers():
+    with _prefetch_lock:
+        while len(_prefetch_threads) < PREFETCH_WORKERS:
+            thread = threading.Thread(target=_prefetch_loop, name="prefetch", daemon=True)
+            thread.start()
+            _prefetch_threads.append(thread)
+
+def schedule_prefetch(level_ids, song_ids, next_query):
+    """Queue warming of a page's levels, songs and the page after it, most likely clicks first."""
+    _start_prefetch_workers()
+    tasks = [("level", level_id) for level_id in level_ids] + [("song", song_id) for song_id in song_ids]
+    if next_query is not None:
+        tasks.append(("page", next_query))
+    now = time.monotonic()
+    for task in tasks:
+        with _prefetch_lock:
+            if task in _prefetch_pending:
+                continue
+            try:
+                _prefetch_queue.put_nowait((now, task))
+            except queue.Full:
+                prefetch_tasks.inc("dropped")
+                continue
+            _prefetch_pending.add(task)
+
 if __name__ == "__main__":
+    for db_file in db_files():
+        if os.path.exists(db_file):
+            migrate_db(db_file)
+    if sys.argv[1:] == ["migrate"]:
+        sys.exit(0)
+    if sys.argv[1:] == ["build-level-index"]:
+        refresh_level_index(full=True)
+        sys.exit(0)
+    if sys.argv[1:] == ["rebuild-fts"]:
+        for db_file in db_files():
+            rebuild_fts(db_file)
+        sys.exit(0)
+    if sys.argv[1:] == ["rebuild-facets"]:
+        for db_file in db_files():
+            rebuild_facets(db_file)
+        sys.exit(0)
+    if sys.argv[1:2] == ["shard"] and len(sys.argv) == 3:
+        # Split levels.db into N files; set DB_SHARD_COUNT = N to serve them
+        shard_db(int(sys.argv[2]))
+        sys.exit(0)
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,358 @@
+# Asyncio serving mode for the level browser.
+#
+#   uvicorn browseUnlistedAsync:app --host 0.0.0.0 --port 5000
+#
+# /downloadSong is handled natively on the event loop: Boomlings lookups and
+# CDN transfers use a non-blocking HTTP client, so slow upstreams only cost
+# an idle coroutine instead of a worker thread. Every other route is the
+# regular Flask app, run on its own bounded thread pool; the blocking SQLite
+# and file work of the song handler gets a separate one, so searches never
+# queue behind song downloads.
+
+import asyncio
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+import httpx
+
+import browseUnlisted as browser
+
+# Threads for the Flask routes
+FLASK_WORKERS = 32
+# Threads for the song handler's SQLite / file work
+BLOCKING_WORKERS = 32
+# Upper bound on simultaneous upstream connections
+UPSTREAM_MAX_CONNECTIONS = 1000
+
+# Endpoint label for the song route's metrics, as in the Flask app
+SONG_ENDPOINT = "getSongURL"
+
+SONG_ROUTE = re.compile(r"^/downloadSong/(\d+)$")
+RANGE_HEADER = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Request bodies larger than this are spooled to disk
+WSGI_BODY_MEMORY = 64 * 1024
+
+_client = None
+_song_info_inflight = {}
+_flask_executor = ThreadPoolExecutor(max_workers=FLASK_WORKERS, thread_name_prefix="flask")
+
+async def _run_blocking(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+# --- WSGI Bridge ---
+# Flask requests run on _flask_executor (FLASK_WORKERS threads).
+# asgiref's WsgiToAsgi runs every request on one shared thread instead, and
+# never closes the response iterable, which Flask's close callbacks need.
+
+def wsgi_environ(scope, body):
+    root_path = scope.get("root_path", "").encode("utf-8").decode("latin-1")
+    path = scope["path"].encode("utf-8").decode("latin-1")
+    if path.startswith(root_path):
+        path = path[len(root_path):]
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root_path,
+        "PATH_INFO": path,
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        value = value.decode("latin-1")
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+async def run_flask(scope, receive, send):
+    """Answer one request with the Flask app, run on the blocking thread pool."""
+    loop = asyncio.get_running_loop()
+    with SpooledTemporaryFile(max_size=WSGI_BODY_MEMORY) as body:
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                return  # client went away
+            body.write(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body.seek(0)
+        environ = wsgi_environ(scope, body)
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            start = {}
+
+            def write(chunk):
+                if "sent" not in start:
+                    start["sent"] = True
+                    send_from_thread({
+                        "type": "http.response.start", "status": start["status"], "headers": start["headers"]
+                    })
+                if chunk:
+                    send_from_thread({"type": "http.response.body", "body": chunk, "more_body": True})
+
+            def start_response(status, headers, exc_info=None):
+                start["status"] = int(status.split(" ", 1)[0])
+                start["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+                return write
+
+            result = browser.app(environ, start_response)
+            try:
+                for chunk in result:
+                    write(chunk)
+                write(b"")
+                send_from_thread({"type": "http.response.body", "body": b""})
+            finally:
+                # Runs Flask's call_on_close callbacks (metrics, prefetch)
+                if hasattr(result, "close"):
+                    result.close()
+
+        await loop.run_in_executor(_flask_executor, run)
+
+# --- Song Info ---
+
+async def _fetch_song_info(song_id):
+    data, headers = browser.song_info_request(song_id)
+    browser.upstream_in_flight.inc("song_info")
+    try:
+        with browser.timed("upstream_song_info"):
+            response = await _client.post(browser.BOOMLINGS_SONG_INFO_URL, data=data, headers=headers)
+    finally:
+        browser.upstream_in_flight.dec("song_info")
+    browser.upstream_bytes.inc("song_info", len(response.content))
+    response.raise_for_status()
+    info = browser.parse_song_info(response.text, song_id)
+    await _run_blocking(browser.store_song_info, song_id, info)
+    return info
+
+async def get_song_info(song_id):
+    """Async browser.get_song_info(): same cache, one upstream call per song at a time."""
+    found, info = await _run_blocking(browser.cached_song_info, song_id)
+    if found:
+        return info
+    task = _song_info_inflight.get(song_id)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_song_info(song_id))
+        _song_info_inflight[song_id] = task
+        task.add_done_callback(lambda _: _song_info_inflight.pop(song_id, None))
+    # shield: one client going away must not cancel the lookup for the others
+    return await asyncio.shield(task)
+
+# --- Responses ---
+
+def _header_list(headers):
+    return [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]
+
+async def send_text(send, status, text):
+    body = text.encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": _header_list({
+            "Content-Type": "text/plain; charset=utf-8",
+            "Content-Length": str(len(body)),
+        }),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+def parse_range(value, size):
+    """Return (start, end) for a single 'bytes=' range, None to send the whole
+    file, or False if the range can't be satisfied."""
+    match = RANGE_HEADER.match(value.strip()) if value else None
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+async def send_cached_file(scope, send, path, download_name, mimetype):
+    size = await _run_blocking(os.path.getsize, path)
+    request_headers = dict(scope["headers"])
+    byte_range = parse_range(request_headers.get(b"range", b"").decode("latin-1"), size)
+    headers = {
+        "Content-Type": mimetype,
+        "Content-Disposition": browser.attachment_header(download_name),
+        "Accept-Ranges": "bytes",
+    }
+    if byte_range is False:
+        headers["Content-Range"] = f"bytes */{size}"
+        await send({"type": "http.response.start", "status": 416, "headers": _header_list(headers)})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    status = 200
+    start, end = 0, size - 1
+    if byte_range:
+        status = 206
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    await send({"type": "http.response.start", "status": status, "headers": _header_list(headers)})
+
+    f = await _run_blocking(open, path, "rb")
+    try:
+        await _run_blocking(f.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await _run_blocking(f.read, min(browser.SONG_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            browser.response_bytes.inc(SONG_ENDPOINT, len(chunk))
+            await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b""})
+    finally:
+        await _run_blocking(f.close)
+
+async def download_song(scope, send, song_id):
+    """Async counterpart of browser.getSongURL()."""
+    song_cache = browser.song_cache
+    started = False
+    try:
+        if song_id >= 10000000:
+            # Direct CDN OGG file
+            song_url = browser.SONG_CDN_URL.format(song_id=song_id)
+            library = await _run_blocking(browser.get_music_library)
+            song_name = library.get(song_id, f"song_{song_id}")
+            mimetype = "audio/ogg"
+            ext = "ogg"
+        else:
+            # Use Boomlings API
+            info = await get_song_info(song_id)
+            if info is None:
+                raise LookupError(f"song {song_id} is not available")
+            song_url, song_name = info
+            mimetype = "audio/mpeg"
+            ext = "mp3"
+
+        download_name = f"{song_name}.{ext}"
+        cache_key = f"{song_id}.{ext}"
+        cached_path = await _run_blocking(song_cache.lookup, cache_key) if song_cache.max_bytes else None
+        if cached_path:
+            started = True
+            await send_cached_file(scope, send, cached_path, download_name, mimetype)
+            return
+
+        # Relay the file as it arrives, saving a copy for next time
+        browser.upstream_in_flight.inc("song")
+        try:
+            requested = time.perf_counter()
+            async with _client.stream("GET", song_url) as upstream:
+                if browser.METRICS_ENABLED:
+                    browser.stage_seconds.observe("upstream_song", time.perf_counter() - requested)
+                upstream.raise_for_status()
+                headers = {
+                    "Content-Type": mimetype,
+                    "Content-Disposition": browser.attachment_header(download_name),
+                }
+                if "content-length" in upstream.headers and "content-encoding" not in upstream.headers:
+                    headers["Content-Length"] = upstream.headers["content-length"]
+
+                temp_path = None
+                f = None
+                if song_cache.max_bytes:
+                    temp_path = await _run_blocking(song_cache.temp_path, cache_key)
+                    f = await _run_blocking(open, temp_path, "wb")
+                complete = False
+                try:
+                    started = True
+                    await send({"type": "http.response.start", "status": 200, "headers": _header_list(headers)})
+                    async for chunk in upstream.aiter_bytes(browser.SONG_CHUNK_SIZE):
+                        if f is not None:
+                            await _run_blocking(f.write, chunk)
+                        browser.upstream_bytes.inc("song", len(chunk))
+                        browser.response_bytes.inc(SONG_ENDPOINT, len(chunk))
+                        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                    await send({"type": "http.response.body", "body": b""})
+                    complete = True
+                finally:
+                    if f is not None:
+                        await _run_blocking(f.close)
+                        if complete:
+                            await _run_blocking(song_cache.commit, temp_path, cache_key)
+                        else:
+                            await _run_blocking(song_cache.discard, temp_path)
+        finally:
+            browser.upstream_in_flight.dec("song")
+
+    except Exception:
+        if started:
+            # Headers are already out; let the server drop the connection
+            raise
+        await send_text(send, 500, browser.SONG_UNAVAILABLE_MESSAGE)
+
+# --- ASGI Entry Point ---
+
+async def _lifespan(receive, send):
+    global _client
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            loop = asyncio.get_running_loop()
+            # _run_blocking uses the default executor
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=BLOCKING_WORKERS))
+            connect_timeout, read_timeout = browser.HTTP_TIMEOUT
+            _client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=UPSTREAM_MAX_CONNECTIONS,
+                    max_keepalive_connections=browser.HTTP_POOL_SIZE
+                ),
+                follow_redirects=True
+            )
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _client is not None:
+                await _client.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] == "http" and scope["method"] == "GET":
+        match = SONG_ROUTE.match(scope["path"])
+        if match:
+            if browser.METRICS_ENABLED:
+                browser.requests_in_flight.inc(SONG_ENDPOINT)
+                started = time.perf_counter()
+            try:
+                await download_song(scope, send, int(match.group(1)))
+            finally:
+                if browser.METRICS_ENABLED:
+                    browser.request_seconds.observe(SONG_ENDPOINT, time.perf_counter() - started)
+                    browser.requests_in_flight.dec(SONG_ENDPOINT)
+            return
+    if scope["type"] == "http":
+        await run_flask(scope, receive, send)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("browseUnlistedAsync:app", host="0.0.0.0", port=5000)
@@ -0,0 +1,278 @@
+# Build or refresh levels.db from the '{ID} - name.txt' files under SAVE_DIR.
+#
+#   python ingestLevels.py [--workers N] [--full] [--prune]
+#
+# Files are parsed with browseUnlisted.parse_level_data in a process pool and
+# written in large batched transactions. The mtime and size of every ingested
+# file are recorded, so later runs only re-parse files that changed.
+
+import argparse
+import base64
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import browseUnlisted as browser
+
+BATCH_SIZE = 5000
+# Files handed to a worker process at a time
+CHUNK_SIZE = 64
+# Chunks queued per worker process; bounds memory however large SAVE_DIR is
+CHUNKS_PER_WORKER = 4
+
+LEVEL_COLUMNS = (
+    "ID", "Name", "Username", "CreatorPoints", "Description", "Size", "songID",
+    "OriginalID", "rCoins", "sCoins", "Version", "Length", "EditorTime", "EditorCTime",
+    "RequestedRating", "TwoPlayer", "ObjectCount",
+)
+
+# Columns the level files don't (always) contain: a re-ingest only
+# overwrites them when the file actually provided a value
+KEEP_IF_EMPTY = ("Username", "CreatorPoints")
+
+# Level response keys for the columns copied over as they are
+RAW_FIELDS = {
+    "Name": "2",
+    "OriginalID": "30",
+    "rCoins": "37",
+    "sCoins": "38",
+    "Version": "5",
+    "EditorTime": "46",
+    "EditorCTime": "47",
+    "RequestedRating": "39",
+    "ObjectCount": "45",
+}
+
+LENGTHS = {"0": "Tiny", "1": "Short", "2": "Medium", "3": "Long", "4": "XL", "5": "Platformer"}
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS levels (
+      ID INTEGER PRIMARY KEY,
+      Name TEXT,
+      Username TEXT,
+      CreatorPoints INTEGER,
+      Description TEXT,
+      Size TEXT,
+      songID TEXT,
+      OriginalID TEXT,
+      rCoins TEXT,
+      sCoins TEXT,
+      Version TEXT,
+      Length TEXT,
+      EditorTime TEXT,
+      EditorCTime TEXT,
+      RequestedRating TEXT,
+      TwoPlayer TEXT,
+      ObjectCount TEXT
+    );
+    CREATE TABLE IF NOT EXISTS ingest_files (
+      dir TEXT NOT NULL,
+      name TEXT NOT NULL,
+      level_id INTEGER,
+      mtime_ns INTEGER NOT NULL,
+      size INTEGER NOT NULL,
+      PRIMARY KEY (dir, name)
+    );
+"""
+
+def decode_description(value):
+    try:
+        return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode("utf-8")
+    except ValueError:
+        return value
+
+def level_row(path, data, size):
+    """Turn the contents of a level file into a levels row (None if it has no ID)."""
+    level_part, *extra = data.split("#")
+    pairs = browser.parse_level_data(level_part)
+
+    level_id = pairs.get("1") or browser._level_id_from_filename(os.path.basename(path))
+    try:
+        level_id = int(level_id)
+    except (TypeError, ValueError):
+        return None
+
+    row = {column: pairs.get(key, "") for column, key in RAW_FIELDS.items()}
+    row["ID"] = level_id
+    row["Description"] = decode_description(pairs.get("3", ""))
+    row["Size"] = f"{size} B"
+    row["Length"] = LENGTHS.get(pairs.get("15", ""), pairs.get("15", ""))
+    row["TwoPlayer"] = {"1": "Yes", "0": "No"}.get(pairs.get("31", ""), "")
+    custom_song = pairs.get("35", "")
+    row["songID"] = pairs.get("52") or (custom_song if custom_song not in ("", "0") else "")
+    # Some saves append the creator as '#playerID:username:accountID'
+    row["Username"] = ""
+    for segment in reversed(extra):
+        parts = segment.strip().split(":")
+        if len(parts) == 3 and parts[0].isdigit() and parts[2].isdigit():
+            row["Username"] = parts[1]
+            break
+    row["CreatorPoints"] = ""
+    return tuple(row[column] for column in LEVEL_COLUMNS)
+
+def parse_level_file(job):
+    """Worker: (dir, name, mtime_ns, size) -> (dir, name, mtime_ns, size, row or None)."""
+    dir_path, name, mtime_ns, size = job
+    path = os.path.join(dir_path, name)
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            data = f.read()
+    except OSError:
+        return dir_path, name, mtime_ns, size, None
+    return dir_path, name, mtime_ns, size, level_row(path, data, size)
+
+def parse_level_files(jobs):
+    """Worker: parse_level_file() for a chunk of jobs."""
+    return [parse_level_file(job) for job in jobs]
+
+def iter_chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+def iter_changed_files(conn, save_dir, full, seen_dirs, removed):
+    """Walk save_dir and yield (dir, name, mtime_ns, size) for new or changed files.
+
+    Files recorded in ingest_files that no longer exist are appended to removed.
+    """
+    stack = [os.path.normpath(save_dir)]
+    while stack:
+        dir_path = stack.pop()
+        seen_dirs.add(dir_path)
+        known = {
+            name: (mtime_ns, size)
+            for name, mtime_ns, size in conn.execute(
+                "SELECT name, mtime_ns, size FROM ingest_files WHERE dir = ?", (dir_path,)
+            )
+        }
+        try:
+            with os.scandir(dir_path) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        present = set()
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+                continue
+            if browser._level_id_from_filename(entry.name) is None:
+                continue
+            present.add(entry.name)
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            if full or known.get(entry.name) != (st.st_mtime_ns, st.st_size):
+                yield dir_path, entry.name, st.st_mtime_ns, st.st_size
+        removed.extend((dir_path, name) for name in known.keys() - present)
+
+def insert_sql():
+    return f"INSERT INTO levels ({', '.join(LEVEL_COLUMNS)}) VALUES ({', '.join('?' * len(LEVEL_COLUMNS))})"
+
+def update_sql():
+    # Not an upsert: its conflict clause would override the OR IGNORE in the
+    # level_songs trigger
+    updates = []
+    for i, column in enumerate(LEVEL_COLUMNS[1:], start=2):
+        if column in KEEP_IF_EMPTY:
+            updates.append(f"{column} = CASE WHEN ?{i} = '' THEN {column} ELSE ?{i} END")
+        else:
+            updates.append(f"{column} = ?{i}")
+    return f"UPDATE levels SET {', '.join(updates)} WHERE ID = ?1"
+
+def write_batch(conn, batch):
+    rows = {job[4][0]: job[4] for job in batch if job[4] is not None}
+    existing = {
+        level_id for (level_id,) in conn.execute(
+            "SELECT ID FROM levels WHERE ID IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(rows)),)
+        )
+    }
+    with conn:
+        conn.executemany(insert_sql(), [row for level_id, row in rows.items() if level_id not in existing])
+        conn.executemany(update_sql(), [row for level_id, row in rows.items() if level_id in existing])
+        conn.executemany(
+            "INSERT OR REPLACE INTO ingest_files (dir, name, level_id, mtime_ns, size) VALUES (?, ?, ?, ?, ?)",
+            [(d, n, row[0] if row else None, m, s) for d, n, m, s, row in batch]
+        )
+
+def prune(conn, removed, seen_dirs, delete_levels):
+    """Forget files that disappeared, optionally deleting their levels."""
+    for (dir_path,) in conn.execute("SELECT DISTINCT dir FROM ingest_files").fetchall():
+        if dir_path not in seen_dirs:
+            removed.extend(
+                (dir_path, name) for (name,) in
+                conn.execute("SELECT name FROM ingest_files WHERE dir = ?", (dir_path,)).fetchall()
+            )
+    with conn:
+        for dir_path, name in removed:
+            row = conn.execute(
+                "SELECT level_id FROM ingest_files WHERE dir = ? AND name = ?", (dir_path, name)
+            ).fetchone()
+            conn.execute("DELETE FROM ingest_files WHERE dir = ? AND name = ?", (dir_path, name))
+            if delete_levels and row and row[0] is not None:
+                # Another file may still provide the same level
+                if not conn.execute("SELECT 1 FROM ingest_files WHERE level_id = ?", (row[0],)).fetchone():
+                    conn.execute("DELETE FROM levels WHERE ID = ?", (row[0],))
+
+def ingest(db_file, save_dir, workers=None, full=False, delete_levels=False):
+    started = time.monotonic()
+    conn = sqlite3.connect(db_file, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.executescript(SCHEMA)
+    conn.execute("CREATE INDEX IF NOT EXISTS ingest_files_level ON ingest_files(level_id)")
+
+    seen_dirs = set()
+    removed = []
+    parsed = 0
+    batch = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Walk, parse and write as we go: only a window of chunks is in
+        # flight, refilled as results come back in order
+        chunks = iter_chunks(iter_changed_files(conn, save_dir, full, seen_dirs, removed), CHUNK_SIZE)
+        window = (workers or os.cpu_count() or 1) * CHUNKS_PER_WORKER
+        pending = deque(pool.submit(parse_level_files, chunk) for chunk in itertools.islice(chunks, window))
+        while pending:
+            results = pending.popleft().result()
+            for chunk in itertools.islice(chunks, 1):
+                pending.append(pool.submit(parse_level_files, chunk))
+            for result in results:
+                batch.append(result)
+                if len(batch) >= BATCH_SIZE:
+                    write_batch(conn, batch)
+                    parsed += len(batch)
+                    batch = []
+                    print(f"{parsed} files ingested...", file=sys.stderr)
+    if batch:
+        write_batch(conn, batch)
+        parsed += len(batch)
+
+    prune(conn, removed, seen_dirs, delete_levels)
+    conn.close()
+
+    # Typed columns, song table and full-text index; built in bulk when new
+    browser.migrate_db(db_file)
+    print(
+        f"Ingested {parsed} new or changed files, forgot {len(removed)} removed ones "
+        f"in {time.monotonic() - started:.1f}s"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync levels.db with the level files in SAVE_DIR.")
+    parser.add_argument("--db", default=browser.DB_FILE, help="database file (default: %(default)s)")
+    parser.add_argument("--save-dir", default=browser.SAVE_DIR, help="level files directory (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument("--full", action="store_true", help="re-parse every file, not just changed ones")
+    parser.add_argument("--prune", action="store_true", help="delete levels whose files were removed")
+    args = parser.parse_args()
+    ingest(args.db, args.save_dir, workers=args.workers, full=args.full, delete_levels=args.prune)
+
+if __name__ == "__main__":
+    main()